@@ -0,0 +1,91 @@
+"""Бенчмарк парсинга DAG-файлов: регрессионная проверка скорости импорта.
+
+Каждый замер — отдельный процесс Python, как у DAG-процессора после рестарта.
+Airflow импортируется до начала замера, поэтому меряется только стоимость
+самих DAG-файлов и пакета vacancy_etl. Дополнительно проверяется, что при
+парсинге не подгружаются тяжёлые зависимости задач.
+
+Запуск (нужен установленный Airflow):
+    python benchmarks/dag_parse_benchmark.py --runs 10 --budget-ms 150
+Код возврата 1 — бюджет превышен или тяжёлый модуль попал в импорт.
+"""
+
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+from pathlib import Path
+
+DAG_FOLDER = Path(__file__).resolve().parent.parent / 'dag'
+DAG_FILES = [
+    DAG_FOLDER / 'vacancy_pipline_gpt_rerty.py',
+    DAG_FOLDER / 'vacancy_pipline_gpt_events.py',
+]
+FORBIDDEN_MODULES = ['pandas', 'boto3', 'botocore', 'requests']
+
+# Код, выполняемый в отдельном процессе: импорт Airflow, затем замер DAG-файла
+_PROBE = '''
+import importlib.util, json, sys, time
+sys.path.insert(0, {dag_folder!r})
+import airflow
+from airflow import DAG
+from airflow.operators.python import PythonOperator
+preloaded = {{name for name in {forbidden!r} if name in sys.modules}}
+start = time.perf_counter()
+spec = importlib.util.spec_from_file_location('vacancy_dag_probe', {dag_file!r})
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+elapsed_ms = (time.perf_counter() - start) * 1000
+loaded = [name for name in {forbidden!r} if name in sys.modules and name not in preloaded]
+print(json.dumps({{'elapsed_ms': elapsed_ms, 'heavy_modules': loaded}}))
+'''
+
+
+def run_probe(dag_file):
+    """Парсит DAG-файл в новом процессе и возвращает время и список тяжёлых модулей."""
+    code = _PROBE.format(
+        dag_folder=str(DAG_FOLDER),
+        dag_file=str(dag_file),
+        forbidden=FORBIDDEN_MODULES,
+    )
+    output = subprocess.run(
+        [sys.executable, '-c', code], check=True, capture_output=True, text=True
+    ).stdout
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--runs', type=int, default=10, help='количество замеров')
+    parser.add_argument('--budget-ms', type=float, default=150.0,
+                        help='допустимая медиана парсинга DAG-файла, мс')
+    args = parser.parse_args()
+
+    failed = False
+    for dag_file in DAG_FILES:
+        timings = []
+        heavy_modules = set()
+        for _ in range(args.runs):
+            result = run_probe(dag_file)
+            timings.append(result['elapsed_ms'])
+            heavy_modules.update(result['heavy_modules'])
+
+        median_ms = statistics.median(timings)
+        print(f"Парсинг {dag_file.name}: {args.runs} замеров")
+        print(f"  медиана: {median_ms:.1f} мс, мин: {min(timings):.1f} мс, макс: {max(timings):.1f} мс")
+        print(f"  бюджет: {args.budget_ms:.1f} мс")
+
+        if heavy_modules:
+            print(f"❌ При парсинге импортируются тяжёлые модули: {sorted(heavy_modules)}")
+            failed = True
+        if median_ms > args.budget_ms:
+            print("❌ Бюджет на парсинг превышен")
+            failed = True
+    if not failed:
+        print("✅ Парсинг укладывается в бюджет")
+    return 1 if failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,5 @@
+"""Логика ETL-пайплайна вакансий: задачи Airflow для DAG vacancy_pipline_gpt_rerty.
+
+Модули пакета не импортируют pandas/boto3/requests на уровне модуля —
+тяжёлые зависимости подгружаются только при выполнении задач.
+"""
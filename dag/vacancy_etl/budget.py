@@ -0,0 +1,156 @@
+"""Планировщик GPT: дедлайн и бюджет на запуск."""
+
+import json
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+
+from vacancy_etl.storage import BUCKET_NAME, get_s3_client
+
+GPT_RUN_DEADLINE = timedelta(hours=2)     # Сколько времени от начала GPT-работы отводим на обе GPT-задачи
+GPT_MAX_REQUESTS_PER_RUN = 300           # Лимит запросов к API на весь запуск (заголовки + сферы)
+GPT_MAX_TOKENS_PER_RUN = 600_000         # Лимит токенов на весь запуск (заголовки + сферы)
+GPT_PENDING_PREFIX = 'processed/pending/'  # Куда записываем то, что не успели обработать
+# Задача, которая готовит данные для GPT и отмечает начало GPT-работы (а не старт DAG run:
+# в событийном DAG сенсор может ждать файлы часами до того, как GPT-задачи вообще начнутся)
+GPT_START_TASK_ID = 'process_latest_file'
+
+
+class GptRunBudget:
+    """Следит за дедлайном и расходом запросов/токенов GPT в рамках одного запуска DAG."""
+
+    def __init__(self, deadline, max_requests, max_tokens, spent_requests=0, spent_tokens=0):
+        self.deadline = deadline
+        self.max_requests = max_requests
+        self.max_tokens = max_tokens
+        self.spent_requests = spent_requests
+        self.spent_tokens = spent_tokens
+        self._lock = threading.Lock()  # Батчи GPT обрабатываются параллельно
+
+    @classmethod
+    def for_run(cls, upstream_task_id=None, **kwargs):
+        """Создаёт бюджет запуска: дедлайн — от отметки mark_gpt_start, расход предыдущей GPT-задачи — из XCom."""
+        started_at = kwargs['ti'].xcom_pull(task_ids=GPT_START_TASK_ID, key='gpt_started_at')
+        if started_at:
+            run_start = datetime.fromisoformat(started_at)
+        else:
+            run_start = datetime.now(timezone.utc)
+        spent = {}
+        if upstream_task_id:
+            spent = kwargs['ti'].xcom_pull(task_ids=upstream_task_id, key='gpt_budget') or {}
+        return cls(
+            deadline=run_start + GPT_RUN_DEADLINE,
+            max_requests=GPT_MAX_REQUESTS_PER_RUN,
+            max_tokens=GPT_MAX_TOKENS_PER_RUN,
+            spent_requests=spent.get('spent_requests', 0),
+            spent_tokens=spent.get('spent_tokens', 0),
+        )
+
+    def restore(self, usage):
+        """Добавляет расход, уже сделанный прошлыми попытками этой задачи (из чекпоинтов)."""
+        with self._lock:
+            self.spent_requests += usage.get('requests', 0)
+            self.spent_tokens += usage.get('tokens', 0)
+
+    def seconds_left(self):
+        return (self.deadline - datetime.now(timezone.utc)).total_seconds()
+
+    def exhausted(self):
+        """Возвращает причину остановки или None, если бюджет ещё есть."""
+        if self.seconds_left() <= 0:
+            return 'дедлайн'
+        if self.spent_requests >= self.max_requests:
+            return 'лимит запросов'
+        if self.spent_tokens >= self.max_tokens:
+            return 'лимит токенов'
+        return None
+
+    def request_timeout(self, default=60):
+        """Таймаут запроса, не выходящий за дедлайн."""
+        return max(1, min(default, self.seconds_left()))
+
+    def sleep(self, seconds):
+        """Пауза между попытками, урезанная до оставшегося времени."""
+        time.sleep(max(0, min(seconds, self.seconds_left())))
+
+    def start_request(self):
+        """Учитывает отправленный запрос (даже если он завершится ошибкой)."""
+        with self._lock:
+            self.spent_requests += 1
+
+    def add_usage(self, api_result):
+        """Учитывает токены из ответа API и возвращает их количество."""
+        usage = api_result.get('result', {}).get('usage', {})
+        tokens = int(usage.get('totalTokens', 0) or 0)
+        with self._lock:
+            self.spent_tokens += tokens
+        return tokens
+
+    def to_dict(self):
+        return {
+            'spent_requests': self.spent_requests,
+            'spent_tokens': self.spent_tokens,
+            'max_requests': self.max_requests,
+            'max_tokens': self.max_tokens,
+            'deadline': self.deadline.isoformat(),
+        }
+
+
+def mark_gpt_start(ti):
+    """Отмечает в XCom начало GPT-работы запуска: от него отсчитывается GPT_RUN_DEADLINE."""
+    started_at = datetime.now(timezone.utc).isoformat()
+    ti.xcom_push(key='gpt_started_at', value=started_at)
+    return started_at
+
+
+def order_by_coverage(item_to_records, pending=()):
+    """Сортирует элементы по числу покрываемых записей (самые ценные первыми).
+
+    При равном покрытии вперёд идут элементы, отложенные прошлым запуском.
+    """
+    pending = set(pending)
+    return sorted(
+        item_to_records,
+        key=lambda item: (-len(item_to_records[item]), item not in pending, item)
+    )
+
+
+def pending_key(stage, **kwargs):
+    """Ключ файла с остатком этапа: у каждого DAG свой, чтобы запуски не перетирали чужие остатки."""
+    dag_id = getattr(kwargs.get('dag'), 'dag_id', None) or 'manual'
+    return f"{GPT_PENDING_PREFIX}{dag_id}/{stage}.json"
+
+
+def load_pending_records(stage, **kwargs):
+    """Записи, отложенные прошлым запуском этого DAG для этапа stage."""
+    s3_client = get_s3_client()
+    try:
+        obj = s3_client.get_object(Bucket=BUCKET_NAME, Key=pending_key(stage, **kwargs))
+        return json.loads(obj['Body'].read().decode('utf-8')).get('records', [])
+    except Exception as e:
+        print(f"Отложенных записей для '{stage}' нет ({e})")
+        return []
+
+
+def save_pending_records(stage, records, reason, **kwargs):
+    """Записывает остаток, который не успели обработать, для следующего запуска.
+
+    Сохраняются сами записи (id, поля для GPT и исходный файл), а не только
+    элементы: следующий запуск добавляет их к своим данным, даже если их файл
+    уже не попадает в его окно.
+    """
+    s3_client = get_s3_client()
+    payload = {
+        'stage': stage,
+        'run_id': kwargs.get('run_id'),
+        'reason': reason,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'records': records,
+    }
+    s3_client.put_object(
+        Bucket=BUCKET_NAME,
+        Key=pending_key(stage, **kwargs),
+        Body=json.dumps(payload, ensure_ascii=False).encode('utf-8'),
+        ContentType='application/json'
+    )
+    print(f"Отложено для следующего запуска: {len(records)} записей ({stage}, причина: {reason or '-'})")
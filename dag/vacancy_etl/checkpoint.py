@@ -0,0 +1,75 @@
+"""Чекпоинты GPT-батчей: повторная попытка задачи продолжает с места падения."""
+
+import hashlib
+import json
+import re
+import uuid
+from datetime import datetime, timezone
+
+from vacancy_etl.storage import BUCKET_NAME, delete_s3_keys, get_s3_client, list_s3_keys
+
+CHECKPOINT_PREFIX = 'processed/checkpoints/'
+
+
+class BatchCheckpointStore:
+    """Append-only хранилище готовых батчей: один объект S3 на батч.
+
+    Ключ: processed/checkpoints/<run_id>/<stage>/batch-<hash>-<uuid>.json, где hash
+    считается по составу батча, а uuid отличает попытки — объекты только
+    добавляются и не перезаписываются, расход каждой попытки сохраняется.
+    """
+
+    def __init__(self, run_id, stage, s3_client=None, bucket_name=BUCKET_NAME):
+        self.stage = stage
+        self.bucket_name = bucket_name
+        self.prefix = f"{CHECKPOINT_PREFIX}{_safe_run_id(run_id)}/{stage}/"
+        self.s3_client = s3_client or get_s3_client()
+
+    def load(self):
+        """Возвращает результаты готовых батчей (original -> элемент) и их расход API."""
+        results = {}
+        usage = {'requests': 0, 'tokens': 0}
+        for key in list_s3_keys(self.s3_client, self.bucket_name, self.prefix, '.json'):
+            obj = self.s3_client.get_object(Bucket=self.bucket_name, Key=key)
+            checkpoint = json.loads(obj['Body'].read().decode('utf-8'))
+            for item in checkpoint.get('results', []):
+                if isinstance(item, dict) and item.get('original'):
+                    results[item['original']] = item
+            usage['requests'] += checkpoint.get('usage', {}).get('requests', 0)
+            usage['tokens'] += checkpoint.get('usage', {}).get('tokens', 0)
+        return results, usage
+
+    def save_batch(self, batch_items, results, requests_spent=0, tokens_spent=0):
+        """Сохраняет результат завершённого батча.
+
+        Ошибка записи не роняет батч: в худшем случае при ретрае он будет запрошен заново.
+        """
+        digest = hashlib.sha1('\n'.join(sorted(batch_items)).encode('utf-8')).hexdigest()[:16]
+        payload = {
+            'stage': self.stage,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'items': list(batch_items),
+            'results': results,
+            'usage': {'requests': requests_spent, 'tokens': tokens_spent},
+        }
+        try:
+            self.s3_client.put_object(
+                Bucket=self.bucket_name,
+                Key=f"{self.prefix}batch-{digest}-{uuid.uuid4().hex[:8]}.json",
+                Body=json.dumps(payload, ensure_ascii=False).encode('utf-8'),
+                ContentType='application/json'
+            )
+        except Exception as e:
+            print(f"⚠️ Не удалось сохранить чекпоинт батча ({self.stage}): {e}")
+
+
+def clear_run_checkpoints(run_id, s3_client=None, bucket_name=BUCKET_NAME):
+    """Удаляет чекпоинты запуска после того, как результат сохранён."""
+    s3_client = s3_client or get_s3_client()
+    keys = list_s3_keys(s3_client, bucket_name, f"{CHECKPOINT_PREFIX}{_safe_run_id(run_id)}/")
+    return delete_s3_keys(s3_client, bucket_name, keys)
+
+
+def _safe_run_id(run_id):
+    """run_id Airflow содержит ':' и '+', в ключах S3 оставляем только безопасные символы."""
+    return re.sub(r'[^A-Za-z0-9_.-]', '_', run_id or 'manual')
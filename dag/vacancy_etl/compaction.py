@@ -0,0 +1,220 @@
+"""ЗАДАЧА 6: Компактизация накопившихся нормализованных файлов.
+
+Части нового поколения сначала пишутся во временный префикс и попадают в
+processed/compacted/ только после публикации манифеста: дашборд читает весь
+префикс, и части упавшей компактизации не должны считаться дважды.
+
+Компактизация инкрементальная: переписываются только части, в диапазон id
+которых (min_id/max_id в манифесте) попадают новые записи. Каждый id лежит
+ровно в одной части, поэтому его прошлая версия всегда в переписываемой части.
+"""
+
+import json
+from bisect import bisect_left
+from datetime import datetime, timezone
+
+from vacancy_etl.storage import BUCKET_NAME, delete_s3_keys, get_s3_client, list_s3_keys
+
+COMPACTION_SOURCE_PREFIX = 'processed/normalized/'
+COMPACTION_TARGET_PREFIX = 'processed/compacted/'
+COMPACTION_MANIFEST_KEY = 'processed/compacted/manifest.json'
+COMPACTION_STAGING_PREFIX = 'processed/compaction_staging/'  # Части поколения до публикации манифеста
+COMPACTION_POOL = 'vacancy_compaction'  # Пул Airflow на 1 слот: компактизации обоих DAG не идут одновременно
+COMPACTION_MIN_FILES = 10                       # Компактизируем, когда накопилось столько мелких файлов
+COMPACTION_TARGET_FILE_BYTES = 64 * 1024 * 1024  # Целевой размер одного итогового файла
+COMPACTION_SMALL_PART_BYTES = COMPACTION_TARGET_FILE_BYTES // 4  # Части меньше переписываем, чтобы они сливались
+COMPACTION_ID_ORDER = 'natural'  # Порядок id в частях и манифесте — см. id_sort_key
+
+
+def compact_normalized_files(**kwargs):
+    import pandas as pd
+
+    print("\n=== Задача 6: Компактизация processed/normalized/ ===")
+
+    s3_client = get_s3_client()
+    bucket_name = BUCKET_NAME
+
+    # 0. Доводим до конца поколение, опубликованное прошлым запуском, и убираем брошенные части
+    previous_manifest = load_manifest(s3_client, bucket_name)
+    finish_generation(s3_client, bucket_name, previous_manifest)
+    stale_keys = list_s3_keys(s3_client, bucket_name, COMPACTION_STAGING_PREFIX)
+    if stale_keys:
+        print(f"Удаляем части неопубликованных поколений: {delete_s3_keys(s3_client, bucket_name, stale_keys)}")
+
+    # 1. Смотрим, сколько мелких файлов накопилось
+    source_keys = sorted(list_s3_keys(s3_client, bucket_name, COMPACTION_SOURCE_PREFIX, '.csv'))
+    print(f"Файлов в {COMPACTION_SOURCE_PREFIX}: {len(source_keys)}")
+    if len(source_keys) < COMPACTION_MIN_FILES:
+        print(f"Меньше {COMPACTION_MIN_FILES} файлов — компактизация не нужна")
+        return
+
+    # 2. Читаем новые файлы и оставляем последнюю версию каждой вакансии по id
+    new_df = _latest_versions(_read_csv_parts(s3_client, bucket_name, source_keys))
+    new_id_keys = sorted(id_sort_key(value) for value in new_df['id'])
+
+    # 3. Из предыдущего поколения переписываем только части, чьи диапазоны id задевают
+    # новые id (плюс мелкие части, чтобы они сливались); остальные остаются как есть
+    previous_files = previous_manifest.get('files', [])
+    full_rewrite = previous_manifest.get('id_order') != COMPACTION_ID_ORDER
+    if previous_files and full_rewrite:
+        print("Манифест без естественного порядка id — переписываем все части один раз")
+    rewrite_files, kept_files = [], []
+    for file_info in previous_files:
+        if (full_rewrite or file_info.get('bytes', 0) < COMPACTION_SMALL_PART_BYTES
+                or _overlaps(file_info, new_id_keys)):
+            rewrite_files.append(file_info)
+        else:
+            kept_files.append(file_info)
+    print(f"Частей предыдущего поколения: {len(previous_files)}, переписываем: {len(rewrite_files)}, "
+          f"без изменений: {len(kept_files)}")
+
+    # 4. Сливаем затронутые части с новыми данными: последняя версия по id, сортировка по id
+    rewrite_df = _read_csv_parts(s3_client, bucket_name, [f['key'] for f in rewrite_files])
+    combined_df = pd.concat([rewrite_df, new_df], ignore_index=True)
+    initial_count = len(combined_df)
+    combined_df = _latest_versions(combined_df)
+    ids = combined_df['id'].tolist()
+    order = sorted(range(len(ids)), key=lambda i: id_sort_key(ids[i]))
+    combined_df = combined_df.iloc[order].reset_index(drop=True)
+    print(f"Записей до дедупликации: {initial_count}, после: {len(combined_df)}")
+
+    # 5. Режем на файлы примерно целевого размера
+    sample_bytes = len(combined_df.head(1000).to_csv(index=False, escapechar='\\').encode('utf-8'))
+    avg_row_bytes = max(1, sample_bytes // max(1, min(1000, len(combined_df))))
+    rows_per_file = max(1, COMPACTION_TARGET_FILE_BYTES // avg_row_bytes)
+    print(f"Средний размер строки: {avg_row_bytes} байт, строк в файле: {rows_per_file}")
+
+    generation = datetime.now().strftime('%Y%m%d_%H%M%S_%f')  # С микросекундами: имя поколения не повторяется
+    manifest_files = []
+    for part_num, start in enumerate(range(0, len(combined_df), rows_per_file)):
+        part_df = combined_df.iloc[start:start + rows_per_file]
+        body = part_df.to_csv(index=False, sep=',', quotechar='"', escapechar='\\').encode('utf-8')
+        part_key = f"{COMPACTION_TARGET_PREFIX}{generation}/part-{part_num:05d}.csv"
+        staging_key = f"{COMPACTION_STAGING_PREFIX}{generation}/part-{part_num:05d}.csv"
+        s3_client.put_object(Bucket=bucket_name, Key=staging_key, Body=body, ContentType='text/csv')
+        manifest_files.append({
+            'key': part_key,
+            'staging_key': staging_key,
+            'rows': len(part_df),
+            'bytes': len(body),
+            'min_id': str(part_df['id'].iloc[0]),
+            'max_id': str(part_df['id'].iloc[-1]),
+        })
+        print(f"   -> {staging_key}: {len(part_df)} записей, {len(body)} байт")
+
+    # 6. Публикуем манифест — с этого момента новое поколение считается текущим.
+    # Вторая линия защиты после пула: если манифест за это время сменился, наше поколение
+    # собрано из устаревших данных — не публикуем его, следующий запуск соберёт заново
+    current_manifest = load_manifest(s3_client, bucket_name)
+    if current_manifest.get('generation') != previous_manifest.get('generation'):
+        delete_s3_keys(s3_client, bucket_name, [f['staging_key'] for f in manifest_files])
+        print(f"⚠️ Манифест обновлён другой компактизацией ({current_manifest.get('generation')}), "
+              f"поколение {generation} не публикуем")
+        return
+    all_files = sorted(kept_files + manifest_files, key=lambda f: id_sort_key(f['min_id']))
+    manifest = {
+        'generation': generation,
+        'created_at': datetime.now(timezone.utc).isoformat(),
+        'row_count': sum(f['rows'] for f in all_files),
+        'columns': list(combined_df.columns),
+        'sort_key': 'id',
+        'id_order': COMPACTION_ID_ORDER,  # min_id/max_id сравниваются через id_sort_key, не как строки
+        'compacted_source_files': len(source_keys),
+        'files': all_files,
+        'source_keys': source_keys,                           # Удаляются после переноса частей
+        'replaced_keys': [f['key'] for f in rewrite_files],   # Переписанные части прошлых поколений
+    }
+    s3_client.put_object(
+        Bucket=bucket_name,
+        Key=COMPACTION_MANIFEST_KEY,
+        Body=json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8'),
+        ContentType='application/json'
+    )
+    print(f"Манифест обновлён: s3://{bucket_name}/{COMPACTION_MANIFEST_KEY}")
+
+    # 7. Переносим части в processed/compacted/ и удаляем то, что теперь входит в новое поколение
+    finish_generation(s3_client, bucket_name, manifest)
+
+    ti = kwargs['ti']
+    ti.xcom_push(key='compaction_manifest', value=COMPACTION_MANIFEST_KEY)
+    return (f"Поколение {generation}: переписано {len(combined_df)} записей в {len(manifest_files)} файлах, "
+            f"всего в наборе {manifest['row_count']}")
+
+
+def load_manifest(s3_client, bucket_name=BUCKET_NAME):
+    """Текущий манифест компактных файлов (пустой, если компактизации ещё не было)."""
+    try:
+        obj = s3_client.get_object(Bucket=bucket_name, Key=COMPACTION_MANIFEST_KEY)
+        return json.loads(obj['Body'].read().decode('utf-8'))
+    except Exception as e:
+        print(f"Манифест не найден, собираем первое поколение ({e})")
+        return {'files': []}
+
+
+def finish_generation(s3_client, bucket_name, manifest):
+    """Переносит части опубликованного поколения из временного префикса и удаляет слитые файлы.
+
+    Идемпотентно: временные части удаляются последними, поэтому после падения
+    на любом шаге следующая компактизация повторит перенос и удаление.
+    """
+    generation = manifest.get('generation')
+    if not generation:
+        return
+    staging_keys = set(list_s3_keys(s3_client, bucket_name, f"{COMPACTION_STAGING_PREFIX}{generation}/"))
+    if not staging_keys:
+        return  # Поколение уже разложено
+
+    published = set(list_s3_keys(s3_client, bucket_name, f"{COMPACTION_TARGET_PREFIX}{generation}/"))
+    for file_info in manifest.get('files', []):
+        if file_info['key'] not in published and file_info.get('staging_key') in staging_keys:
+            s3_client.copy_object(
+                Bucket=bucket_name,
+                Key=file_info['key'],
+                CopySource={'Bucket': bucket_name, 'Key': file_info['staging_key']},
+            )
+    print(f"Поколение {generation} перенесено в {COMPACTION_TARGET_PREFIX}")
+
+    current_keys = {file_info['key'] for file_info in manifest.get('files', [])}
+    merged_keys = manifest.get('source_keys', []) + manifest.get('replaced_keys', [])
+    removed = delete_s3_keys(s3_client, bucket_name, [key for key in merged_keys if key not in current_keys])
+    print(f"Удалено слитых файлов: {removed}")
+    delete_s3_keys(s3_client, bucket_name, sorted(staging_keys))
+
+
+def id_sort_key(value):
+    """Порядок id в компактных файлах: числовые id по значению ('2' < '10'), затем прочие как строки.
+
+    Тот же ключ используется для сравнения min_id/max_id частей: как строки
+    '10' < '2', и отбор частей по диапазону пропускал бы нужные.
+    """
+    value = str(value)
+    if value.isdigit():
+        return (0, int(value), value)
+    return (1, 0, value)
+
+
+def _overlaps(file_info, sorted_id_keys):
+    """Есть ли среди новых id (отсортированных ключей) такие, что попадают в диапазон части."""
+    if 'min_id' not in file_info or 'max_id' not in file_info:
+        return True
+    position = bisect_left(sorted_id_keys, id_sort_key(file_info['min_id']))
+    return position < len(sorted_id_keys) and sorted_id_keys[position] <= id_sort_key(file_info['max_id'])
+
+
+def _read_csv_parts(s3_client, bucket_name, keys):
+    import pandas as pd
+
+    dataframes = []
+    for file_key in keys:
+        obj = s3_client.get_object(Bucket=bucket_name, Key=file_key)
+        df = pd.read_csv(obj['Body'], encoding='utf-8-sig', escapechar='\\', dtype={'id': str})
+        print(f"   {file_key}: {len(df)} записей")
+        dataframes.append(df)
+    return pd.concat(dataframes, ignore_index=True) if dataframes else pd.DataFrame(columns=['id'])
+
+
+def _latest_versions(df):
+    """Последняя версия каждой вакансии по id (по _processing_timestamp, при равенстве — более поздняя строка)."""
+    if df.empty:
+        return df
+    return df.sort_values('_processing_timestamp', kind='stable').drop_duplicates(subset=['id'], keep='last')
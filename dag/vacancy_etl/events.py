@@ -0,0 +1,200 @@
+"""Событийный запуск: ждём новые файлы в vacancies/ и обрабатываем только их.
+
+Обработанные файлы запоминаются в processed/state/event_watermark.json, так что
+каждый запуск берёт небольшую порцию ещё не виденных файлов вместо полного скана.
+Там же считаются неудачные попытки файлов, которые не удалось разобрать: такой файл
+пропускается в запуске, а после EVENT_MAX_FILE_ATTEMPTS неудач — навсегда, и запуск
+помечается упавшим. Ошибки самого запуска (сеть, S3, API) файлам не засчитываются:
+необработанные файлы просто берутся следующим запуском.
+"""
+
+import asyncio
+import json
+from datetime import datetime, timedelta, timezone
+
+from airflow.sensors.base import BaseSensorOperator
+from airflow.triggers.base import BaseTrigger, TriggerEvent
+
+from vacancy_etl.storage import BUCKET_NAME, VACANCY_PREFIX, get_s3_client, list_vacancy_files
+
+EVENT_STATE_KEY = 'processed/state/event_watermark.json'
+EVENT_MAX_FILES_PER_RUN = 4   # Размер микробатча файлов на один запуск
+EVENT_POLL_INTERVAL = 60      # Как часто (с) триггер проверяет бакет
+EVENT_MAX_FILE_ATTEMPTS = 3   # После стольких запусков, не сумевших разобрать файл, он пропускается
+
+
+def load_event_state(s3_client, bucket_name=BUCKET_NAME):
+    """Состояние событийного DAG: обработанные файлы и неудачные попытки по файлам."""
+    try:
+        obj = s3_client.get_object(Bucket=bucket_name, Key=EVENT_STATE_KEY)
+        state = json.loads(obj['Body'].read().decode('utf-8'))
+    except Exception as e:
+        print(f"Состояние событийного запуска не найдено, считаем все файлы новыми ({e})")
+        state = {}
+    return {
+        'processed_files': set(state.get('processed_files', [])),
+        'failed_files': state.get('failed_files', {}),
+    }
+
+
+def save_event_state(s3_client, state, bucket_name=BUCKET_NAME, prefix=VACANCY_PREFIX):
+    """Записывает состояние; файлы, которых уже нет в бакете, из него выкидываем."""
+    existing = set(list_vacancy_files(s3_client, bucket_name, prefix))
+    processed = state['processed_files'] & existing
+    failed = {key: info for key, info in state['failed_files'].items() if key in existing and key not in processed}
+    payload = {
+        'updated_at': datetime.now(timezone.utc).isoformat(),
+        'processed_files': sorted(processed),
+        'failed_files': failed,
+    }
+    s3_client.put_object(
+        Bucket=bucket_name,
+        Key=EVENT_STATE_KEY,
+        Body=json.dumps(payload, ensure_ascii=False).encode('utf-8'),
+        ContentType='application/json'
+    )
+    return len(processed)
+
+
+def find_new_vacancy_files(s3_client=None, bucket_name=BUCKET_NAME, prefix=VACANCY_PREFIX,
+                           max_files=EVENT_MAX_FILES_PER_RUN):
+    """Самые старые ещё не обработанные файлы (не больше max_files).
+
+    Файлы, исчерпавшие EVENT_MAX_FILE_ATTEMPTS, пропускаются.
+    """
+    s3_client = s3_client or get_s3_client()
+    state = load_event_state(s3_client, bucket_name)
+    failed = state['failed_files']
+    new_files = sorted(
+        key for key in list_vacancy_files(s3_client, bucket_name, prefix)
+        if key not in state['processed_files']
+        and failed.get(key, {}).get('attempts', 0) < EVENT_MAX_FILE_ATTEMPTS
+    )
+    return new_files[:max_files] if max_files else new_files
+
+
+def mark_files_processed(s3_client, files, bucket_name=BUCKET_NAME, prefix=VACANCY_PREFIX):
+    """Добавляет файлы в состояние; файлы, которых уже нет в бакете, из состояния выкидываем."""
+    state = load_event_state(s3_client, bucket_name)
+    state['processed_files'] |= set(files)
+    return save_event_state(s3_client, state, bucket_name, prefix)
+
+
+def mark_files_failed(s3_client, file_errors, bucket_name=BUCKET_NAME, prefix=VACANCY_PREFIX, run_id=None):
+    """Засчитывает файлам ({ключ: ошибка}) неудачную попытку; возвращает файлы, исчерпавшие попытки.
+
+    Повтор задачи в том же запуске (тот же run_id) второй попыткой не считается.
+    """
+    state = load_event_state(s3_client, bucket_name)
+    given_up = []
+    for key, error in file_errors.items():
+        if key in state['processed_files']:
+            continue
+        info = state['failed_files'].setdefault(key, {'attempts': 0})
+        if run_id is None or info.get('last_run_id') != run_id:
+            info['attempts'] += 1
+        info['last_error'] = str(error)[:500]
+        info['last_run_id'] = run_id
+        info['failed_at'] = datetime.now(timezone.utc).isoformat()
+        if info['attempts'] >= EVENT_MAX_FILE_ATTEMPTS:
+            given_up.append(key)
+    save_event_state(s3_client, state, bucket_name, prefix)
+    return given_up
+
+
+class NewVacancyFilesTrigger(BaseTrigger):
+    """Триггер для triggerer: опрашивает бакет, пока не появятся новые файлы."""
+
+    def __init__(self, bucket_name=BUCKET_NAME, prefix=VACANCY_PREFIX,
+                 max_files=EVENT_MAX_FILES_PER_RUN, poll_interval=EVENT_POLL_INTERVAL):
+        super().__init__()
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.max_files = max_files
+        self.poll_interval = poll_interval
+
+    def serialize(self):
+        return ('vacancy_etl.events.NewVacancyFilesTrigger', {
+            'bucket_name': self.bucket_name,
+            'prefix': self.prefix,
+            'max_files': self.max_files,
+            'poll_interval': self.poll_interval,
+        })
+
+    async def run(self):
+        while True:
+            # boto3 синхронный — уводим опрос в поток, чтобы не блокировать event loop
+            files = await asyncio.to_thread(
+                find_new_vacancy_files, None, self.bucket_name, self.prefix, self.max_files
+            )
+            if files:
+                yield TriggerEvent({'files': files})
+                return
+            await asyncio.sleep(self.poll_interval)
+
+
+class NewVacancyFilesSensor(BaseSensorOperator):
+    """Ждёт новые CSV в vacancies/ и отдаёт их в XCom (file_list, bucket_name).
+
+    В режиме deferrable ожидание уходит в triggerer и не занимает слот воркера.
+    """
+
+    def __init__(self, *, bucket_name=BUCKET_NAME, prefix=VACANCY_PREFIX,
+                 max_files=EVENT_MAX_FILES_PER_RUN, deferrable=True, **kwargs):
+        super().__init__(**kwargs)
+        self.bucket_name = bucket_name
+        self.prefix = prefix
+        self.max_files = max_files
+        self.deferrable = deferrable
+
+    def poke(self, context):
+        files = find_new_vacancy_files(None, self.bucket_name, self.prefix, self.max_files)
+        if files:
+            self._push_files(context, files)
+            return True
+        print("Новых файлов нет")
+        return False
+
+    def execute(self, context):
+        if not self.deferrable:
+            return super().execute(context)
+        # Быстрая проверка на месте, чтобы не откладываться, если файлы уже есть
+        if self.poke(context):
+            return None
+        self.defer(
+            trigger=NewVacancyFilesTrigger(self.bucket_name, self.prefix, self.max_files, self.poke_interval),
+            method_name='execute_complete',
+            timeout=timedelta(seconds=self.timeout),
+        )
+
+    def execute_complete(self, context, event=None):
+        self._push_files(context, event['files'])
+
+    def _push_files(self, context, files):
+        print(f"Новые файлы для обработки ({len(files)}): {files}")
+        context['ti'].xcom_push(key='file_list', value=files)
+        context['ti'].xcom_push(key='bucket_name', value=self.bucket_name)
+
+
+# ========== ЗАДАЧА: Фиксация обработанных файлов ==========
+def commit_processed_files(**kwargs):
+    from airflow.exceptions import AirflowException
+
+    ti = kwargs['ti']
+    print("\n=== Фиксируем обработанные файлы ===")
+
+    files = ti.xcom_pull(task_ids='process_latest_file', key='source_files') or []
+    bucket_name = ti.xcom_pull(task_ids='process_latest_file', key='bucket_name') or BUCKET_NAME
+    given_up = ti.xcom_pull(task_ids='process_latest_file', key='given_up_files') or []
+    if files:
+        total = mark_files_processed(get_s3_client(), files, bucket_name)
+        print(f"Отмечено обработанными: {len(files)}, всего в состоянии: {total}")
+    else:
+        print("Нет обработанных файлов для фиксации")
+
+    # Остальные файлы уже зафиксированы; запуск помечаем упавшим, чтобы пропуск файла заметили
+    if given_up:
+        raise AirflowException(
+            f"❌ Файлы пропущены после {EVENT_MAX_FILE_ATTEMPTS} неудачных попыток разбора: {given_up} "
+            f"(см. failed_files в s3://{bucket_name}/{EVENT_STATE_KEY})"
+        )
@@ -0,0 +1,708 @@
+"""Запросы к YandexGPT: каскад моделей, разбор ответа и статистика по уровням каскада.
+
+Первый проход делает быстрая дешёвая модель; элементы, которые вернулись как
+"Не определена"/"Другое" или с категорией не из списка, уходят следующему,
+более сильному уровню каскада.
+"""
+
+import json
+import re
+import socket
+import threading
+import time
+from collections import Counter, deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from vacancy_etl.prompts import OTHER_LABEL, UNDEFINED_LABEL
+from vacancy_etl.vocabulary import LabelVocabulary
+
+GPT_COMPLETION_URL = "https://llm.api.cloud.yandex.net/foundationModels/v1/completion"
+GPT_TIER_MAX_ATTEMPTS = 2  # Попыток на уровень при сетевых/HTTP ошибках
+GPT_STREAMING = True       # Читать ответ потоком и разбирать элементы по мере готовности
+
+# Хеджирование: если батч не ответил за перцентиль недавних задержек уровня,
+# отправляем дубль запроса и берём первый валидный ответ, второй отменяем
+GPT_HEDGING = {
+    'enabled': True,
+    'percentile': 95,        # Задержка перед дублем — этот перцентиль недавних ответов уровня
+    'min_samples': 10,       # Пока замеров меньше — не хеджируем
+    'min_delay': 5,          # Не дублируем раньше, чем через столько секунд
+    'max_hedge_ratio': 0.1,  # Дублей не больше этой доли от запросов уровня (квота API)
+    'history': 200,          # Сколько последних задержек учитываем
+    'cancel_grace': 1.0,     # Сколько ждём отменённый запрос, чтобы его токены попали в расход батча
+}
+
+# Каскад моделей для каждого этапа: у уровня свой размер батча, таймаут и параллелизм
+TITLE_MODEL_CASCADE = [
+    {'name': 'lite', 'model': 'yandexgpt-lite/rc', 'batch_size': 15, 'timeout': 60, 'max_workers': 4},
+    {'name': 'pro', 'model': 'yandexgpt/latest', 'batch_size': 10, 'timeout': 90, 'max_workers': 2},
+]
+FIELD_MODEL_CASCADE = [
+    {'name': 'lite', 'model': 'yandexgpt-lite/rc', 'batch_size': 10, 'timeout': 60, 'max_workers': 4},
+    {'name': 'pro', 'model': 'yandexgpt/latest', 'batch_size': 5, 'timeout': 90, 'max_workers': 2},
+]
+
+# Статусы ответа по элементу: чем больше, тем лучше
+_STATUS_MISSING, _STATUS_INVALID, _STATUS_ESCALATE, _STATUS_OK = range(4)
+
+_usage_lock = threading.Lock()  # Расход батча пополняют основной запрос и дубль из разных потоков
+
+
+class ClassificationStage:
+    """Описание этапа классификации: промпт, поле с категорией и допустимые значения."""
+
+    def __init__(self, name, label_field, allowed_labels, build_prompt, cascade, result_fields,
+                 label_aliases=None):
+        self.name = name
+        self.label_field = label_field
+        self.allowed_labels = set(allowed_labels)
+        # "Не определена" тоже в словаре: его варианты написания приводим к точной метке
+        self.vocabulary = LabelVocabulary(list(allowed_labels) + [UNDEFINED_LABEL], aliases=label_aliases)
+        self.build_prompt = build_prompt
+        self.cascade = cascade
+        self.result_fields = result_fields  # Поля ответа, которые заполняем заглушкой
+
+    def undefined_result(self, original):
+        result = {'original': original}
+        for field in self.result_fields:
+            result[field] = UNDEFINED_LABEL
+        return result
+
+    def snap_label(self, item):
+        """Приводит почти верную категорию к допустимой; возвращает (элемент, исходная метка или None)."""
+        label = item.get(self.label_field)
+        if label in self.allowed_labels or label == UNDEFINED_LABEL:
+            return item, None
+        snapped, _ = self.vocabulary.match(label)
+        if snapped is None:
+            return item, None
+        item = dict(item)
+        item[self.label_field] = snapped
+        return item, label
+
+    def label_status(self, item):
+        label = item.get(self.label_field, '')
+        if not label or label == UNDEFINED_LABEL:
+            return _STATUS_ESCALATE if label else _STATUS_INVALID
+        if label not in self.allowed_labels:
+            return _STATUS_INVALID
+        if label == OTHER_LABEL:
+            return _STATUS_ESCALATE
+        return _STATUS_OK
+
+
+class RequestCancel:
+    """Отмена запроса из другого потока: флаг плюс обрыв соединения.
+
+    Ответ (requests.Response) регистрируется через attach сразу после получения
+    заголовков; cancel() делает shutdown его сокета, и заблокированное чтение
+    потока сразу прерывается, не дожидаясь следующей строки или таймаута
+    (response.close() из чужого потока ждал бы, пока чтение само вернётся).
+    Если заголовков ещё нет, соединение обрывается в момент attach.
+    """
+
+    def __init__(self):
+        self._cancelled = False
+        self._socket = None
+        self._lock = threading.Lock()
+
+    def attach(self, response):
+        sock = _response_socket(response)
+        if sock is None:
+            print("      ⚠️ Не нашли сокет ответа: отмена не оборвёт соединение, запрос дождётся конца потока")
+        with self._lock:
+            self._socket = sock
+            cancelled = self._cancelled
+        if cancelled:
+            _shutdown_socket(sock)
+
+    def cancel(self):
+        with self._lock:
+            self._cancelled = True
+            sock = self._socket
+        _shutdown_socket(sock)
+
+    def is_set(self):
+        return self._cancelled
+
+
+def _response_socket(response):
+    """Сокет ответа requests: у соединения, а если http.client уже отдал его ответу — у буфера чтения."""
+    raw = response.raw
+    sock = getattr(getattr(raw, '_connection', None), 'sock', None)
+    if sock is None:
+        # Ответ без Content-Length (поток): http.client отвязывает сокет от соединения
+        sock = getattr(getattr(getattr(getattr(raw, '_fp', None), 'fp', None), 'raw', None), '_sock', None)
+    return sock
+
+
+def _shutdown_socket(sock):
+    if sock is None:
+        return
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass  # Соединение уже закрыто
+
+
+class _RequestAnswers:
+    """Ответы одного запроса (у основного запроса и дубля — свои), почти верные категории правятся сразу."""
+
+    def __init__(self, stage, wanted):
+        self.stage = stage
+        self.wanted = set(wanted)
+        self.answers = {}
+        self.snaps = []  # (ответ модели, допустимая метка)
+
+    def on_item(self, item):
+        # Берём только элементы из текущего запроса
+        if isinstance(item, dict) and item.get('original') in self.wanted and item['original'] not in self.answers:
+            item, raw_label = self.stage.snap_label(item)
+            if raw_label is not None:
+                self.snaps.append((raw_label, item[self.stage.label_field]))
+            self.answers[item['original']] = item
+        return len(self.answers) == len(self.wanted)
+
+
+class TierStats:
+    """Задержки и успешность одного уровня каскада (потокобезопасно)."""
+
+    def __init__(self, name, model):
+        self.name = name
+        self.model = model
+        self.latencies = []          # Фактическая задержка батча (с хеджированием)
+        self.primary_latencies = []  # Задержка основного запроса — то, что было бы без хеджирования
+        self.censored = 0            # Основной запрос отменён после победы дубля: его задержка — нижняя оценка
+        self.requests = 0
+        self.errors = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.items_sent = 0
+        self.items_accepted = 0
+        self.snapped = Counter()     # (ответ модели, допустимая метка) -> сколько раз исправили локально
+        self._lock = threading.Lock()
+
+    def record_snap(self, raw_label, label):
+        with self._lock:
+            self.snapped[(raw_label, label)] += 1
+
+    def record(self, latency, items_sent, items_accepted, timing=None):
+        timing = timing or {}
+        with self._lock:
+            self.requests += 1
+            self.latencies.append(latency)
+            self.primary_latencies.append(timing.get('primary_latency', latency))
+            self.censored += int(timing.get('primary_censored', False))
+            self.hedges += int(timing.get('hedged', False))
+            self.hedge_wins += int(timing.get('hedge_won', False))
+            self.items_sent += items_sent
+            self.items_accepted += items_accepted
+
+    def record_error(self):
+        with self._lock:
+            self.requests += 1
+            self.errors += 1
+
+    def summary(self):
+        success_rate = (self.items_accepted / self.items_sent * 100) if self.items_sent else 0.0
+        return {
+            'tier': self.name,
+            'model': self.model,
+            'requests': self.requests,
+            'errors': self.errors,
+            'items_sent': self.items_sent,
+            'items_accepted': self.items_accepted,
+            'success_rate': round(success_rate, 1),
+            'latency_p50': round(percentile(self.latencies, 50), 2),
+            'latency_p95': round(percentile(self.latencies, 95), 2),
+            'latency_p99': round(percentile(self.latencies, 99), 2),
+            'latency_max': round(max(self.latencies, default=0.0), 2),
+            'unhedged_p50': round(percentile(self.primary_latencies, 50), 2),
+            'unhedged_p95': round(percentile(self.primary_latencies, 95), 2),
+            'unhedged_p99': round(percentile(self.primary_latencies, 99), 2),
+            'unhedged_censored': self.censored,
+            'hedges': self.hedges,
+            'hedge_wins': self.hedge_wins,
+            'snapped': sum(self.snapped.values()),
+            'snapped_examples': [f"{raw} → {label}" for (raw, label), _ in self.snapped.most_common(5)],
+        }
+
+
+class HedgingPolicy:
+    """Когда отправлять дубль запроса: задержка по перцентилю истории и лимит на число дублей."""
+
+    def __init__(self, config=GPT_HEDGING):
+        self.config = config
+        self.history = deque(maxlen=config['history'])
+        self.primaries = 0
+        self.hedges = 0
+        self._lock = threading.Lock()
+
+    def delay(self):
+        """Через сколько секунд без ответа дублировать запрос (None — пока не хеджируем)."""
+        with self._lock:
+            if len(self.history) < self.config['min_samples']:
+                return None
+            return max(self.config['min_delay'], percentile(list(self.history), self.config['percentile']))
+
+    def observe(self, latency):
+        with self._lock:
+            self.primaries += 1
+            self.history.append(latency)
+
+    def try_acquire_hedge(self, budget):
+        """Разрешает дубль, если не превышен лимит дублей и бюджет запуска."""
+        with self._lock:
+            if budget.exhausted() or self.hedges + 1 > self.config['max_hedge_ratio'] * max(1, self.primaries):
+                return False
+            self.hedges += 1
+            return True
+
+
+def percentile(values, q):
+    """Перцентиль по методу ближайшего ранга (0.0 для пустого списка)."""
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    rank = max(1, -(-len(ordered) * q // 100))  # ceil(len * q / 100)
+    return ordered[int(rank) - 1]
+
+
+class JsonObjectStream:
+    """Инкрементальный разбор ответа модели: отдаёт JSON-объекты по мере их закрытия.
+
+    Ответ — JSON-массив объектов, возможно в обёртке ```json или обрезанный по
+    таймауту/maxTokens. Закрытые объекты верхнего уровня возвращаются сразу,
+    незакрытый хвост просто ждёт следующих данных.
+    """
+
+    def __init__(self):
+        self.buffer = ''
+        self._pos = 0
+        self._depth = 0
+        self._start = None
+        self._in_string = False
+        self._escape = False
+
+    def feed(self, text):
+        """Добавляет кусок текста и возвращает объекты, закрывшиеся в нём."""
+        self.buffer += text
+        items = []
+        for i in range(self._pos, len(self.buffer)):
+            ch = self.buffer[i]
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif ch == '\\':
+                    self._escape = True
+                elif ch == '"':
+                    self._in_string = False
+            elif ch == '"' and self._depth > 0:
+                self._in_string = True
+            elif ch == '{':
+                if self._depth == 0:
+                    self._start = i
+                self._depth += 1
+            elif ch == '}' and self._depth > 0:
+                self._depth -= 1
+                if self._depth == 0:
+                    try:
+                        item = json.loads(self.buffer[self._start:i + 1])
+                    except json.JSONDecodeError:
+                        continue
+                    if isinstance(item, dict):
+                        items.append(item)
+        self._pos = len(self.buffer)
+        return items
+
+
+def safe_json_parse(text):
+    """Достаёт JSON-массив из ответа модели (с обёртками ```json и лишним текстом).
+
+    Если массив битый или обрезан, спасаем все успевшие закрыться объекты.
+    """
+    text = text.strip().strip('`')
+    if text.startswith('json'):
+        text = text[4:].strip()
+
+    try:
+        return json.loads(text)
+    except json.JSONDecodeError:
+        json_match = re.search(r'\[\s*\{.*\}\s*\]', text, re.DOTALL)
+        if json_match:
+            try:
+                return json.loads(json_match.group())
+            except json.JSONDecodeError:
+                pass
+        return JsonObjectStream().feed(text)
+
+
+def add_batch_usage(usage, requests=0, tokens=0):
+    """Пополняет расход батча (для чекпоинта): запросы — при отправке, токены — по каждому ответу."""
+    if usage is None:
+        return
+    with _usage_lock:
+        usage['requests'] += requests
+        usage['tokens'] += tokens
+
+
+def request_completion(prompt, model_uri, api_key, timeout, budget, on_item=None, cancel_event=None,
+                       usage=None):
+    """Один запрос к YandexGPT; возвращает текст ответа и потраченные токены.
+
+    В потоковом режиме (GPT_STREAMING) каждый закрывшийся JSON-объект сразу
+    передаётся в on_item; если on_item вернул True, поток закрываем досрочно —
+    все нужные элементы уже получены. Объекты, отданные до обрыва/таймаута,
+    остаются у вызывающего даже если функция завершилась исключением.
+    cancel_event (RequestCancel) позволяет закрыть поток снаружи (проигравший
+    хедж-запрос); закрытие отменой не считается ошибкой.
+    usage — расход батча: запрос учитывается при отправке, токены — даже у
+    оборванного или проигравшего запроса, как и в budget.
+    """
+    import requests
+
+    payload = {
+        "modelUri": model_uri,
+        "completionOptions": {
+            "stream": GPT_STREAMING,
+            "temperature": 0.3,
+            "maxTokens": 4000
+        },
+        "messages": [{"role": "user", "text": prompt}]
+    }
+    headers = {
+        "Content-Type": "application/json",
+        "Authorization": f"Api-Key {api_key}"
+    }
+    timeout = budget.request_timeout(timeout)
+
+    budget.start_request()
+    add_batch_usage(usage, requests=1)
+    if not GPT_STREAMING:
+        response = requests.post(GPT_COMPLETION_URL, headers=headers, json=payload, timeout=timeout)
+        response.raise_for_status()
+
+        result = response.json()
+        tokens = budget.add_usage(result)
+        add_batch_usage(usage, tokens=tokens)
+        return result['result']['alternatives'][0]['message']['text'], tokens
+
+    started = time.monotonic()
+    parser = JsonObjectStream()
+    text = ''
+    last_chunk = None
+    try:
+        with requests.post(GPT_COMPLETION_URL, headers=headers, json=payload,
+                           timeout=timeout, stream=True) as response:
+            if cancel_event is not None:
+                cancel_event.attach(response)
+            response.raise_for_status()
+            response.encoding = 'utf-8'
+            try:
+                for line in response.iter_lines(decode_unicode=True):
+                    if not line:
+                        continue
+                    last_chunk = json.loads(line)
+                    chunk_text = last_chunk['result']['alternatives'][0]['message']['text']
+                    # API присылает накопленный текст; на всякий случай поддерживаем и дельты
+                    if chunk_text.startswith(text):
+                        delta, text = chunk_text[len(text):], chunk_text
+                    else:
+                        delta, text = chunk_text, text + chunk_text
+                    finished = False
+                    for item in parser.feed(delta):
+                        if on_item and on_item(item):
+                            finished = True
+                    if finished or (cancel_event is not None and cancel_event.is_set()):
+                        break
+                    if time.monotonic() - started > timeout:
+                        raise TimeoutError(f"поток не завершился за {timeout:.0f} с")
+            except Exception:
+                # Соединение закрыто отменой — не ошибка, результат проигравшего всё равно не нужен
+                if cancel_event is None or not cancel_event.is_set():
+                    raise
+    finally:
+        tokens = budget.add_usage(last_chunk) if last_chunk else 0
+        add_batch_usage(usage, tokens=tokens)
+    return text, tokens
+
+
+def run_classification_stage(stage, items, api_key, folder_id, budget, on_batch_done=None):
+    """Прогоняет элементы через каскад моделей батчами первого уровня.
+
+    Батчи обрабатываются параллельно (max_workers первого уровня), неудачные
+    элементы батча эскалируются на следующий уровень. on_batch_done(batch, results,
+    usage) вызывается после завершения каждого батча — например, для чекпоинта;
+    в results только элементы, на которые модель ответила (упавшие запросы при
+    повторе задачи отправятся заново).
+
+    Возвращает (результаты по original, отложенные из-за бюджета элементы, статистика уровней).
+    """
+    first_tier = stage.cascade[0]
+    batch_size = first_tier['batch_size']
+    batches = [items[start:start + batch_size] for start in range(0, len(items), batch_size)]
+    tier_stats = [TierStats(tier['name'], tier['model']) for tier in stage.cascade]
+    tier_slots = [threading.BoundedSemaphore(tier['max_workers']) for tier in stage.cascade]
+    # Без потока ответ читается целиком и отменить его нельзя — дубль только тратил бы квоту
+    hedging = [HedgingPolicy() if GPT_HEDGING['enabled'] and GPT_STREAMING else None for _ in stage.cascade]
+    hedge_pool = ThreadPoolExecutor(max_workers=2 * sum(tier['max_workers'] for tier in stage.cascade))
+
+    print(f"\n=== Каскад моделей ({stage.name}) ===")
+    for tier in stage.cascade:
+        print(f"  {tier['name']}: {tier['model']}, батч {tier['batch_size']}, "
+              f"таймаут {tier['timeout']} с, потоков {tier['max_workers']}")
+    print(f"Батчей первого уровня: {len(batches)}")
+
+    def process_batch(batch_index, batch):
+        if budget.exhausted():
+            return [], list(batch)  # Бюджет кончился до старта батча — весь батч откладываем
+        usage = {'requests': 0, 'tokens': 0}
+        best = {}
+        pending = list(batch)
+        cut = []  # Элементы, которые не прошли каскад до конца из-за бюджета
+
+        for tier_index, tier in enumerate(stage.cascade):
+            if not pending:
+                break
+            if budget.exhausted():
+                cut.extend(pending)
+                break
+            model_uri = f"gpt://{folder_id}/{tier['model']}"
+            escalate = []
+            for start in range(0, len(pending), tier['batch_size']):
+                chunk = pending[start:start + tier['batch_size']]
+                with tier_slots[tier_index]:
+                    answers = _classify_chunk(
+                        stage, tier, tier_index, chunk, model_uri, api_key,
+                        budget, tier_stats[tier_index], usage, hedging[tier_index], hedge_pool,
+                        tier_slots[tier_index]
+                    )
+                for original in chunk:
+                    answer = answers.get(original)
+                    if answer is None and budget.exhausted():
+                        cut.append(original)  # Запрос не отправлен или оборван бюджетом
+                        continue
+                    status = stage.label_status(answer) if answer else _STATUS_MISSING
+                    if status > best.get(original, (_STATUS_MISSING - 1, None))[0]:
+                        best[original] = (status, answer)
+                    if status != _STATUS_OK:
+                        escalate.append(original)
+            if escalate and tier_index + 1 < len(stage.cascade):
+                print(f"    [батч {batch_index}] {tier['name']}: эскалируем {len(escalate)} "
+                      f"→ {stage.cascade[tier_index + 1]['name']}")
+            pending = escalate
+
+        results = []
+        cut_set = set(cut)
+        for original in batch:
+            if original in cut_set:
+                continue
+            status, answer = best.get(original, (_STATUS_MISSING, None))
+            # "Другое" от последнего уровня — валидный ответ; мусор и пропуски — заглушка
+            if status >= _STATUS_ESCALATE and answer.get(stage.label_field) != UNDEFINED_LABEL:
+                results.append(answer)
+            else:
+                results.append(stage.undefined_result(original))
+        defined = sum(1 for r in results if r.get(stage.label_field) not in [UNDEFINED_LABEL, OTHER_LABEL])
+        print(f"✅ Батч {batch_index}/{len(batches)}: {defined}/{len(batch)} определено"
+              + (f", отложено из-за бюджета: {len(cut)}" if cut else ""))
+
+        if on_batch_done:
+            answered = [item for item in results if best.get(item['original'], (None, None))[1] is not None]
+            on_batch_done(batch, answered, usage)
+        return results, cut
+
+    all_results = {}
+    deferred = []
+    with ThreadPoolExecutor(max_workers=first_tier['max_workers']) as pool:
+        futures = [pool.submit(process_batch, index, batch) for index, batch in enumerate(batches, 1)]
+        for batch, future in zip(batches, futures):
+            try:
+                batch_results, batch_deferred = future.result()
+            except Exception as e:
+                print(f"❌ Ошибка в батче после всех попыток: {e}")
+                batch_results, batch_deferred = [stage.undefined_result(original) for original in batch], []
+            deferred.extend(batch_deferred)
+            for item in batch_results:
+                all_results[item['original']] = item
+
+    hedge_pool.shutdown(wait=False)
+
+    stats = [s.summary() for s in tier_stats]
+    print(f"\n⏱ Статистика уровней каскада ({stage.name}):")
+    for s in stats:
+        print(f"  {s['tier']} ({s['model']}): запросов {s['requests']}, ошибок {s['errors']}, "
+              f"принято {s['items_accepted']}/{s['items_sent']} ({s['success_rate']}%), "
+              f"макс. задержка {s['latency_max']} с")
+        print(f"    с хеджированием:  p50 {s['latency_p50']} с, p95 {s['latency_p95']} с, p99 {s['latency_p99']} с "
+              f"(дублей {s['hedges']}, выиграли {s['hedge_wins']})")
+        print(f"    без хеджирования: p50 {s['unhedged_p50']} с, p95 {s['unhedged_p95']} с, p99 {s['unhedged_p99']} с "
+              f"(отменённых основных запросов: {s['unhedged_censored']} — для них это нижняя оценка)")
+        if s['snapped']:
+            print(f"    исправлено по словарю категорий: {s['snapped']} ({', '.join(s['snapped_examples'])})")
+    return all_results, deferred, stats
+
+
+def _classify_chunk(stage, tier, tier_index, chunk, model_uri, api_key, budget, stats, usage,
+                    hedging=None, hedge_pool=None, tier_slot=None):
+    """Запрос уровня каскада (с повтором при ошибке); возвращает ответы по original.
+
+    Элементы, полученные до обрыва потока, сохраняются: повтор отправляет только остаток.
+    """
+    answers = {}
+
+    def merge(request_answers):
+        # Берём ответы одного запроса целиком: основной и дубль не смешиваются
+        for original, item in request_answers.answers.items():
+            answers.setdefault(original, item)
+        for raw_label, label in request_answers.snaps:
+            stats.record_snap(raw_label, label)
+
+    for attempt in range(GPT_TIER_MAX_ATTEMPTS):
+        remaining = [original for original in chunk if original not in answers]
+        if not remaining or budget.exhausted():
+            break
+        prompt = stage.build_prompt(remaining, attempt=tier_index)
+        started = time.monotonic()
+        collectors = []
+
+        def new_collector():
+            collector = _RequestAnswers(stage, remaining)
+            collectors.append(collector)
+            return collector
+
+        try:
+            text, tokens, timing, winner = _hedged_completion(
+                prompt, model_uri, api_key, tier, budget, new_collector, hedging, hedge_pool, usage,
+                tier_slot
+            )
+        except Exception as e:
+            # Все запросы упали: спасаем то, что успел прислать самый полный из них
+            salvaged = max(collectors, key=lambda c: len(c.answers), default=None)
+            if salvaged is not None and salvaged.answers:
+                merge(salvaged)
+                received = list(salvaged.answers.values())
+                print(f"      {tier['name']}: поток прерван ({e}), сохранили {len(received)}/{len(remaining)}")
+                accepted = sum(1 for item in received if stage.label_status(item) == _STATUS_OK)
+                stats.record(time.monotonic() - started, len(remaining), accepted)
+            else:
+                stats.record_error()
+                print(f"      {tier['name']}: ошибка запроса ({len(remaining)} элементов): {e}")
+            if attempt + 1 < GPT_TIER_MAX_ATTEMPTS:
+                budget.sleep(3)  # Пауза при ошибке
+            continue
+
+        parsed = safe_json_parse(text)
+        for item in parsed if isinstance(parsed, list) else []:
+            winner.on_item(item)
+        merge(winner)
+        received = [answers[original] for original in remaining if original in answers]
+        accepted = sum(1 for item in received if stage.label_status(item) == _STATUS_OK)
+        stats.record(time.monotonic() - started, len(remaining), accepted, timing)
+        if not received:
+            print(f"      {tier['name']}: не получили валидный JSON ({len(text)} символов)")
+        break  # Ответ получен целиком: недостающие элементы эскалируем, а не повторяем
+    return answers
+
+
+def _hedged_completion(prompt, model_uri, api_key, tier, budget, new_collector, hedging, hedge_pool, usage=None,
+                       tier_slot=None):
+    """request_completion с хеджированием: дубль после задержки, побеждает первый валидный ответ.
+
+    У каждого запроса свой сборщик ответов (new_collector()), наружу отдаётся
+    только сборщик победителя. Проигравший запрос отменяется через RequestCancel:
+    его соединение закрывается.
+    Слот основного запроса держит вызывающий; дубль занимает ещё один слот уровня
+    (tier_slot) и отдаёт его, только когда завершились оба запроса — так проигравший,
+    переживший cancel_grace, всё ещё учтён в max_workers. Свободного слота нет — дубля нет.
+    Возвращает (текст, токены победителя, тайминги для статистики, сборщик победителя).
+    """
+    timing = {'hedged': False, 'hedge_won': False, 'primary_censored': False}
+    started = time.monotonic()
+
+    def call(cancel):
+        collector = new_collector()
+        text, tokens = request_completion(
+            prompt, model_uri, api_key, tier['timeout'], budget, collector.on_item, cancel, usage
+        )
+        return text, tokens, collector
+
+    delay = hedging.delay() if hedging else None
+    if delay is None:
+        # Без хеджирования (выключено или мало истории) — обычный запрос, но копим историю задержек
+        text, tokens, collector = call(None)
+        timing['primary_latency'] = time.monotonic() - started
+        if hedging:
+            hedging.observe(timing['primary_latency'])
+        return text, tokens, timing, collector
+
+    cancels = {}
+    primary_cancel = RequestCancel()
+    primary = hedge_pool.submit(call, primary_cancel)
+    cancels[primary] = primary_cancel
+
+    done, _ = wait([primary], timeout=delay)
+    if not done and (tier_slot is None or tier_slot.acquire(blocking=False)):
+        if hedging.try_acquire_hedge(budget):
+            print(f"      {tier['name']}: нет ответа за {delay:.1f} с, отправляем дубль запроса")
+            hedge_cancel = RequestCancel()
+            cancels[hedge_pool.submit(call, hedge_cancel)] = hedge_cancel
+            timing['hedged'] = True
+            if tier_slot is not None:
+                _release_when_done(list(cancels), tier_slot)
+        elif tier_slot is not None:
+            tier_slot.release()
+
+    # Ждём первый валидный ответ; невалидный/упавший запрос не мешает дождаться второго
+    winner, fallback, error = None, None, None
+    remaining = set(cancels)
+    while remaining and winner is None:
+        done, remaining = wait(remaining, return_when=FIRST_COMPLETED)
+        for future in done:
+            if future is primary:
+                timing['primary_latency'] = time.monotonic() - started
+            if future.exception() is not None:
+                error = future.exception()
+            elif safe_json_parse(future.result()[0]):
+                winner = future
+                break
+            else:
+                fallback = future
+    winner = winner or fallback
+
+    # Отменяем проигравших: обрываем их соединения и даём им досчитать токены
+    losers = [future for future in cancels if future is not winner]
+    for future in losers:
+        cancels[future].cancel()
+    if losers:
+        wait(losers, timeout=GPT_HEDGING['cancel_grace'])
+
+    if 'primary_latency' in timing:
+        if primary.exception() is None:
+            hedging.observe(timing['primary_latency'])
+    else:
+        # Основной запрос отменён: его задержка не меньше уже прошедшего времени
+        timing['primary_latency'] = time.monotonic() - started
+        timing['primary_censored'] = True
+    timing['hedge_won'] = winner is not None and winner is not primary
+
+    if winner is None:
+        raise error
+    text, tokens, collector = winner.result()
+    return text, tokens, timing, collector
+
+
+def _release_when_done(futures, slot):
+    """Отдаёт слот, когда завершатся все futures (в том числе отменённые, но ещё читающие)."""
+    left = [len(futures)]
+    lock = threading.Lock()
+
+    def on_done(_):
+        with lock:
+            left[0] -= 1
+            last = left[0] == 0
+        if last:
+            slot.release()
+
+    for future in futures:
+        future.add_done_callback(on_done)
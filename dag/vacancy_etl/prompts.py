@@ -0,0 +1,135 @@
+"""Промпты YandexGPT и списки допустимых категорий для обоих этапов нормализации."""
+
+UNDEFINED_LABEL = 'Не определена'
+OTHER_LABEL = 'Другое'
+
+# Категории для нормализации заголовков вакансий
+TITLE_LABELS = [
+    'Аналитик данных',
+    'BI-аналитик',
+    'Системный аналитик',
+    'Бизнес аналитик',
+    'Веб-аналитик',
+    'Финансовый аналитик',
+    'Продуктовый аналитик',
+    'ML/AI-инженер',
+    'Разработчик',
+    'DevOps-инженер',
+    'Директор по маркетингу',
+    'Генеральный директор',
+    'Коммерческий директор',
+    'Директор по продукту',
+    'Маркетолог',
+    'Главный маркетолог',
+    'Руководитель по контенту',
+    'Директор по продажам',
+    'Специалист по трафику',
+    'Менеджер продукта',
+    OTHER_LABEL,
+]
+
+# Синонимы, которые модель пишет вместо категорий заголовков (сравниваются без учёта регистра и дефисов)
+TITLE_LABEL_ALIASES = {
+    'Data-аналитик': 'Аналитик данных',
+    'Data analyst': 'Аналитик данных',
+    'Аналитик BI': 'BI-аналитик',
+    'Бизнес-аналитик': 'Бизнес аналитик',
+    'Product-аналитик': 'Продуктовый аналитик',
+    'Product manager': 'Менеджер продукта',
+    'Продакт-менеджер': 'Менеджер продукта',
+    'ML-инженер': 'ML/AI-инженер',
+    'Программист': 'Разработчик',
+    'CEO': 'Генеральный директор',
+    'CMO': 'Директор по маркетингу',
+    'Трафик-менеджер': 'Специалист по трафику',
+}
+
+# Широкие категории сфер деятельности: категория -> подсказка для модели
+FIELD_CATEGORY_HINTS = {
+    'IT': 'технологии, разработка, софт, saas, ai, it, crm, big data и подобные',
+    'Финансы': 'мфо, банки, банковские услуги, банкинг, финтех, инвестиции, страхование и подобные',
+    'Ритейл': 'розничная торговля, FMCG и подобные',
+    'E-commerce': 'интернет-магазины, маркетплейсы, e-commerce и подобные',
+    'Производство': 'промышленность, заводы и подобные',
+    'Медицина': 'здравоохранение, фармацевтика и подобные',
+    'Образование': 'EdTech, курсы, онлайн образование и подобные',
+    'Маркетинг': 'реклама, digital, медиа, cpa и подобные',
+    'Логистика': 'доставка, транспорт и подобные',
+    'Туризм': 'путешествия, гостиницы и подобные',
+    'Телеком': 'связь, интернет и подобные',
+    'Недвижимость': 'строительство, аренда и подобные',
+    'Энергетика': 'нефть, газ, электричество и подобные',
+    'Государственный сектор': 'госуслуги, государственный и подобное',
+    'Консалтинг': 'консалтинговые услуги и подобные',
+    'Развлечения': 'азартные игры, igaming, gambling и подобные',
+    'Сфера услуг': 'hr, юридические услуги и подобные',
+}
+FIELD_CATEGORY_LABELS = list(FIELD_CATEGORY_HINTS) + [OTHER_LABEL]
+FIELD_CATEGORY_ALIASES = {
+    'Информационные технологии': 'IT',
+    'ИТ': 'IT',
+    'Финтех': 'Финансы',
+    'Розничная торговля': 'Ритейл',
+    'Электронная коммерция': 'E-commerce',
+    'Здравоохранение': 'Медицина',
+    'Реклама': 'Маркетинг',
+    'Телекоммуникации': 'Телеком',
+    'Госсектор': 'Государственный сектор',
+}
+
+
+def build_title_prompt(items, attempt=0):
+    """Промпт для нормализации заголовков вакансий."""
+    categories = '\n            '.join(f"- {label}" for label in TITLE_LABELS)
+    return f"""
+            Ты — HR-аналитик, классифицируешь вакансии.
+
+            Исходные названия: {', '.join(items)}.
+
+            Приведи каждое название к одной из категорий:
+
+            {categories}
+
+            **Правила**
+            1. НЕ придумывай новые категории
+            2. Если не уверен — ставь "Другое"
+            3. Вакансии пиши с большой буквы (как в примере)
+            4. НЕ добавляй объяснений, комментариев или примеров.
+
+            Верни ТОЛЬКО JSON-массив, где каждый элемент — объект с полями:
+            - "original": исходная строка
+            - "normalized_title": выбранная категория
+            """
+
+
+def build_field_prompt(items, attempt=0):
+    """Промпт для классификации сфер деятельности."""
+    categories = '\n            '.join(
+        f"- {label} (если содержит: {hint})" for label, hint in FIELD_CATEGORY_HINTS.items()
+    )
+    return f"""
+            Ты — HR-аналитик, классифицируешь вакансии.
+            Исходные сферы деятельности: {', '.join(items)}.
+
+            **КАТЕГОРИИ (выбери ОДНУ):**
+            {categories}
+            - Другое (если не было совпадений с категориями выше)
+
+            **ПРАВИЛА (важно для попытки #{attempt + 1}):**
+            1. Выбери ОДНУ основную категорию из списка выше
+            2. Для специализации — укажи самое конкретное из названия
+            3. Если сомневаешься — ставь категорию "Другое"
+            4. Категории и специализации пиши с большой буквы
+            5. Когда смотришь на категории в скобках указаны условия для анализа (записывать их в ответ не нужно)
+            5. {'⚠️ ВНИМАНИЕ: Эти сферы НЕ УДАЛОСЬ классифицировать с первой попытки! Будь более внимательным!' if attempt > 0 else ''}
+
+            **ВНИМАНИЕ:** Если сфера СЛОЖНАЯ (несколько направлений перечисленные через "." или  "/" ):
+            1. Выбери ПЕРВУЮ или ОСНОВНУЮ сферу
+            2. Игнорируй второстепенные
+            3. Если сомневаешься — ставь "Другое"
+
+            Верни ТОЛЬКО JSON-массив, где каждый элемент — объект с полями:
+            - "original": исходная строка
+            - "category": широкая категория (с большой буквы)
+            - "specialization": узкая специализация (с большой буквы)
+            """
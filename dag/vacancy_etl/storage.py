@@ -0,0 +1,120 @@
+"""Доступ к Yandex Object Storage."""
+
+BUCKET_NAME = 'n8n-vacancy-bucket'
+VACANCY_PREFIX = 'vacancies/'  # Сюда n8n складывает новые CSV с вакансиями
+DEFAULT_ENDPOINT_URL = 'https://storage.yandexcloud.net'
+S3_SELECT_ENABLED = True  # Пробовать S3 Select для чтения части колонок; при ошибке — локальный usecols
+
+_s3_select_supported = None  # Выясняется при первом запросе и дальше не перепроверяется
+# Коды ошибок, которыми эндпоинт отвечает, если S3 Select у него нет вообще;
+# остальные ошибки (сеть, кавычки в конкретном файле) — повод прочитать с usecols только этот файл
+S3_SELECT_UNSUPPORTED_CODES = {'NotImplemented', 'MethodNotAllowed'}
+
+
+def get_s3_client():
+    """Создает и возвращает настроенный клиент для Yandex Object Storage."""
+    # boto3/botocore импортируем здесь, а не на уровне модуля: DAG-файл парсится постоянно
+    import boto3
+    from botocore.client import Config
+    from airflow.hooks.base import BaseHook
+
+    conn = BaseHook.get_connection('yandex_object_storage')
+    extra_config = conn.extra_dejson
+    session = boto3.session.Session()
+    # endpoint_url/addressing_style в extra позволяют подключить локальный S3 (MinIO, moto) для тестов
+    return session.client(
+        service_name='s3',
+        endpoint_url=extra_config.get('endpoint_url', DEFAULT_ENDPOINT_URL),
+        aws_access_key_id=extra_config.get('access_key_id'),
+        aws_secret_access_key=extra_config.get('secret_access_key'),
+        config=Config(s3={'addressing_style': extra_config.get('addressing_style', 'virtual')})
+    )
+
+
+def list_s3_keys(s3_client, bucket_name, prefix, suffix=''):
+    """Возвращает все ключи под префиксом (с пагинацией list_objects_v2)."""
+    keys = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=bucket_name, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            if obj['Key'].endswith(suffix):
+                keys.append(obj['Key'])
+    return keys
+
+
+def is_vacancy_file(key):
+    """Полный путь к CSV с вакансиями: не пустой, не папка и не слишком короткое имя."""
+    return bool(key) and key.endswith('.csv') and len(key) > 10
+
+
+def list_vacancy_files(s3_client, bucket_name=BUCKET_NAME, prefix=VACANCY_PREFIX):
+    """Все CSV с вакансиями под префиксом."""
+    return [key for key in list_s3_keys(s3_client, bucket_name, prefix, '.csv') if is_vacancy_file(key)]
+
+
+def delete_s3_keys(s3_client, bucket_name, keys):
+    """Удаляет ключи пачками (delete_objects принимает до 1000 ключей за вызов)."""
+    for start in range(0, len(keys), 1000):
+        chunk = keys[start:start + 1000]
+        s3_client.delete_objects(
+            Bucket=bucket_name,
+            Delete={'Objects': [{'Key': key} for key in chunk], 'Quiet': True}
+        )
+    return len(keys)
+
+
+def read_csv_from_s3(s3_client, bucket_name, key, columns=None):
+    """Читает CSV из Object Storage в DataFrame; с columns — только эти колонки.
+
+    Сначала пробуем S3 Select (проекция на стороне хранилища), если эндпоинт его
+    не поддерживает — парсим потоковое тело объекта с usecols, не загружая его в память целиком.
+    """
+    global _s3_select_supported
+    import pandas as pd
+
+    if columns and S3_SELECT_ENABLED and _s3_select_supported is not False:
+        try:
+            df = _select_csv_columns(s3_client, bucket_name, key, columns)
+            _s3_select_supported = True
+            return df
+        except Exception as e:
+            if _s3_select_error_code(e) in S3_SELECT_UNSUPPORTED_CODES:
+                print(f"   S3 Select не поддерживается эндпоинтом ({e}), дальше читаем с usecols")
+                _s3_select_supported = False
+            else:
+                print(f"   S3 Select не сработал для {key} ({e}), читаем этот файл с usecols")
+
+    obj = s3_client.get_object(Bucket=bucket_name, Key=key)
+    if columns:
+        wanted = set(columns)
+        return pd.read_csv(obj['Body'], usecols=lambda column: column in wanted)
+    return pd.read_csv(obj['Body'])
+
+
+def _s3_select_error_code(error):
+    """Код ошибки S3 из ClientError (None для сетевых и прочих ошибок)."""
+    response = getattr(error, 'response', None) or {}
+    return response.get('Error', {}).get('Code')
+
+
+def _select_csv_columns(s3_client, bucket_name, key, columns):
+    """Проекция колонок CSV через SelectObjectContent."""
+    import io
+    import pandas as pd
+
+    expression = 'SELECT ' + ', '.join(f's."{column}"' for column in columns) + ' FROM S3Object s'
+    response = s3_client.select_object_content(
+        Bucket=bucket_name,
+        Key=key,
+        ExpressionType='SQL',
+        Expression=expression,
+        InputSerialization={
+            'CSV': {'FileHeaderInfo': 'USE', 'AllowQuotedRecordDelimiter': True},
+            'CompressionType': 'NONE',
+        },
+        OutputSerialization={'CSV': {}},
+    )
+    payload = b''.join(
+        event['Records']['Payload'] for event in response['Payload'] if 'Records' in event
+    )
+    return pd.read_csv(io.BytesIO(payload), header=None, names=columns)
@@ -0,0 +1,589 @@
+"""Задачи пайплайна: поиск файлов, обработка, нормализация через YandexGPT, сохранение.
+
+pandas и requests импортируются внутри задач, чтобы не замедлять парсинг DAG.
+"""
+
+from collections import Counter
+from datetime import datetime
+
+from vacancy_etl.budget import (
+    GptRunBudget,
+    load_pending_records,
+    mark_gpt_start,
+    order_by_coverage,
+    save_pending_records,
+)
+from vacancy_etl.checkpoint import BatchCheckpointStore, clear_run_checkpoints
+from vacancy_etl.gpt import FIELD_MODEL_CASCADE, TITLE_MODEL_CASCADE, ClassificationStage, run_classification_stage
+from vacancy_etl.prompts import (
+    FIELD_CATEGORY_ALIASES,
+    FIELD_CATEGORY_LABELS,
+    TITLE_LABEL_ALIASES,
+    TITLE_LABELS,
+    build_field_prompt,
+    build_title_prompt,
+)
+from vacancy_etl.storage import BUCKET_NAME, get_s3_client, is_vacancy_file, list_vacancy_files, read_csv_from_s3
+
+# Этапы классификации: что спрашиваем у модели и какие ответы считаем валидными
+TITLE_STAGE = ClassificationStage(
+    name='titles',
+    label_field='normalized_title',
+    allowed_labels=TITLE_LABELS,
+    build_prompt=build_title_prompt,
+    cascade=TITLE_MODEL_CASCADE,
+    result_fields=['normalized_title'],
+    label_aliases=TITLE_LABEL_ALIASES,
+)
+FIELD_STAGE = ClassificationStage(
+    name='fields',
+    label_field='category',
+    allowed_labels=FIELD_CATEGORY_LABELS,
+    build_prompt=build_field_prompt,
+    cascade=FIELD_MODEL_CASCADE,
+    result_fields=['category', 'specialization'],
+    label_aliases=FIELD_CATEGORY_ALIASES,
+)
+
+# GPT-этапам нужны только эти колонки; полные строки подтягиваются при сохранении
+GPT_INPUT_COLUMNS = ['id', 'title', 'ai_field_of_activity']
+ENRICHED_COLUMNS = ['normalized_title', 'category', 'specialization']
+# Из какого файла запись: внутри запуска — индекс в source_files + pending_files (не ключ в каждой
+# записи XCom), в хранилище отложенных — сам ключ, чтобы дочитать запись в следующем запуске
+SOURCE_FILE_COLUMN = '_source_file'
+
+# Этап -> (задача, поле записи с элементом): откуда брать отложенный остаток при сохранении
+PENDING_STAGES = {
+    'titles': ('title_with_gpt', 'title'),
+    'fields': ('working_with_gpt', 'ai_field_of_activity'),
+}
+
+
+def load_vacancy_files(s3_client, bucket_name, file_keys, columns=None, with_source=False, broken_files=None):
+    """Читает файлы вакансий (все колонки или только columns) и убирает дубликаты.
+
+    with_source=True добавляет колонку SOURCE_FILE_COLUMN с индексом исходного файла в file_keys.
+    С broken_files (dict) файл, который не удалось разобрать, пропускается и попадает туда
+    с текстом ошибки (индексы тогда считаются по file_keys без пропущенных); без него
+    ошибка пробрасывается.
+    """
+    import pandas as pd
+
+    # Список для хранения DataFrame каждого файла
+    all_dataframes = []
+
+    for file_key in file_keys:
+        print(f"Читаем файл: {file_key}")
+        try:
+            df = read_csv_from_s3(s3_client, bucket_name, file_key, columns=columns)
+            if 'id' not in df.columns:
+                raise ValueError("в файле нет колонки 'id'")
+        except ValueError as e:  # ParserError, EmptyDataError, UnicodeDecodeError — ошибки содержимого файла
+            if broken_files is None:
+                raise
+            print(f"❌ Файл не разобран, пропускаем: {file_key} ({e})")
+            broken_files[file_key] = str(e)
+            continue
+        print(f"   -> Загружено {len(df)} записей.")
+        if with_source:
+            df[SOURCE_FILE_COLUMN] = len(all_dataframes)
+        all_dataframes.append(df)
+
+    # Объединяем все DataFrame из списка
+    if all_dataframes:
+        combined_df = pd.concat(all_dataframes, ignore_index=True)
+    else:
+        combined_df = pd.DataFrame(columns=['id'])  # Пустой DataFrame, если файлов не было
+
+    # Удаляем явные дубликаты (если все колонки одинаковые)
+    initial_count = len(combined_df)
+    combined_df = combined_df.drop_duplicates()
+    deduplicated_count = len(combined_df)
+    print(f"Объединено данных: {initial_count} записей.")
+    print(f"После удаления дубликатов: {deduplicated_count} записей.")
+
+    # Удаляем дубликаты по ключевому полю, например 'id'
+    return combined_df.drop_duplicates(subset=['id'])
+
+# ========== ЗАДАЧА 1: Поиск файлов (без изменений) ==========
+def find_files_in_bucket(**kwargs):
+    ti = kwargs['ti']
+    print("=== Задача 1: Ищем файлы в бакете ===")
+
+    s3_client = get_s3_client()
+    bucket_name = BUCKET_NAME
+
+    files = list_vacancy_files(s3_client, bucket_name)
+    for file_key in files:
+        print(f"Найден файл: {file_key}")
+
+    print(f"Всего найдено CSV-файлов: {len(files)}")
+    ti.xcom_push(key='file_list', value=files)
+    ti.xcom_push(key='bucket_name', value=bucket_name)
+
+# ========== ЗАДАЧА 2: Обработка файла (с отправкой данных дальше) ==========
+def process_latest_file(**kwargs):
+    ti = kwargs['ti']
+    print("\n=== Задача 2: Обрабатываем файлы ===")
+
+    # 1. Получаем список файлов из предыдущей задачи
+    # (в событийном DAG список приходит от сенсора новых файлов)
+    files_task_id = kwargs.get('files_task_id', 'find_files_in_bucket')
+    files = ti.xcom_pull(task_ids=files_task_id, key='file_list')
+    bucket_name = ti.xcom_pull(task_ids=files_task_id, key='bucket_name')
+    print(f"Полученный список files (сырой): {files}")
+    print(f"Тип files: {type(files)}")
+    print(f"Длина files: {len(files) if files else 0}")
+
+    if not files:
+        print("Ошибка: Нет файлов для обработки!")
+        return
+
+    # 2. Оставляем только полные пути к CSV-файлам
+    #Игнорируем пустые строки, папки (оканчивающиеся на '/') или слишком короткие имена
+    filtered_files = [f for f in files if is_vacancy_file(f)]
+    print(f"Отфильтрованный список filtered_files: {filtered_files}")
+    print(f"Длина filtered_files: {len(filtered_files)}")
+
+    if not filtered_files:
+        print("Ошибка: Нет подходящих CSV-файлов после фильтрации!")
+        return
+
+    # 3. Сортируем отфильтрованный список и берём последние 4 файлов
+    # (max_files=None — берём все: событийный DAG передаёт только новые файлы)
+    max_files = kwargs.get('max_files', 4)
+    latest_files = sorted(filtered_files)[-max_files:] if max_files else sorted(filtered_files)
+    print(f"Выбраны файлы для обработки: {latest_files}")
+    print(f"Выбраны файлы для обработки: {latest_files}")
+
+    # Готовим переменную для захода в бакет
+    s3_client = get_s3_client()
+
+    # 4. Читаем только колонки, нужные GPT-этапам (полные строки — при сохранении)
+    # (событийный DAG пропускает файлы, которые не удалось разобрать, и засчитывает им неудачную попытку)
+    broken_files = {} if kwargs.get('track_failed_files') else None
+    combined_df = load_vacancy_files(
+        s3_client, bucket_name, latest_files, columns=GPT_INPUT_COLUMNS, with_source=True,
+        broken_files=broken_files,
+    )
+    if broken_files:
+        from vacancy_etl.events import mark_files_failed
+
+        latest_files = [file_key for file_key in latest_files if file_key not in broken_files]
+        given_up = mark_files_failed(s3_client, broken_files, bucket_name, run_id=kwargs.get('run_id'))
+        # Сам запуск продолжаем с остальными файлами; о пропущенных громко сообщит commit_processed_files
+        ti.xcom_push(key='given_up_files', value=given_up)
+
+    # 5. Преобразуем весь итоговый DataFrame в список словарей
+    all_vacancies_data = combined_df.to_dict('records')
+
+    # 6. Добавляем записи, отложенные прошлым запуском из-за бюджета (их файлы могли выйти из окна)
+    pending_records = load_pending_records_for_run(s3_client, bucket_name, combined_df, **kwargs)
+    all_vacancies_data.extend(pending_records)
+    pending_files = sorted({r[SOURCE_FILE_COLUMN] for r in pending_records} - set(latest_files))
+    # Ключ файла -> индекс в общем списке файлов запуска
+    run_files = latest_files + pending_files
+    file_index = {file_key: index for index, file_key in enumerate(run_files)}
+    for record in pending_records:
+        record[SOURCE_FILE_COLUMN] = file_index[record[SOURCE_FILE_COLUMN]]
+    print(f"Итоговые данные для передачи в GPT. Строк: {len(all_vacancies_data)} "
+          f"(из них отложенных прошлым запуском: {len(pending_records)})")
+    if all_vacancies_data:
+        print(f"Колонки в данных: {list(all_vacancies_data[0].keys())}")
+
+    # 7. Отправляем все в XCom (и списки файлов — чтобы при сохранении подтянуть полные строки)
+    ti.xcom_push(key='vacancies_for_gpt', value=all_vacancies_data)
+    ti.xcom_push(key='source_files', value=latest_files)
+    ti.xcom_push(key='pending_files', value=pending_files)
+    ti.xcom_push(key='bucket_name', value=bucket_name)
+    # Дедлайн GPT-этапов отсчитываем отсюда, а не от старта DAG run (сенсор мог ждать часами)
+    mark_gpt_start(ti)
+
+
+def load_pending_records_for_run(s3_client, bucket_name, combined_df, **kwargs):
+    """Отложенные записи обоих этапов, которых нет среди свежих данных и чей файл ещё в бакете."""
+    known_ids = set(combined_df['id'].astype(str)) if 'id' in combined_df else set()
+    existing_files = set(list_vacancy_files(s3_client, bucket_name))
+    pending = {}
+    dropped = 0
+    for stage in PENDING_STAGES:
+        for record in load_pending_records(stage, **kwargs):
+            record_id = str(record.get('id'))
+            if record_id in known_ids or record_id in pending:
+                continue
+            if record.get(SOURCE_FILE_COLUMN) not in existing_files:
+                dropped += 1  # Исходный файл удалён — полную строку уже не собрать
+                continue
+            pending[record_id] = record
+    if dropped:
+        print(f"⚠️ Пропущено отложенных записей без исходного файла: {dropped}")
+    return list(pending.values())
+
+# ========== ЗАДАЧА 3: Изменение заголовков через YandexGPT (каскад моделей) ==========
+def title_with_gpt(**kwargs):
+    from airflow.hooks.base import BaseHook
+
+    ti = kwargs['ti']
+    print("\n=== Задача 3: Нормализация заголовков вакансий через GPT ===")
+
+    raw_data = ti.xcom_pull(task_ids='process_latest_file', key='vacancies_for_gpt')
+    if not raw_data:
+        print("Ошибка: Нет данных для обработки!")
+        return
+    
+    print(f"Получено {len(raw_data)} записей для нормализации.")
+    
+    # 1. Собираем все уникальные заголовки
+    all_titles = []
+    title_to_records = {}
+    
+    for idx, record in enumerate(raw_data):
+        title = record.get('title', '').strip()
+        if title:
+            all_titles.append(title)
+            if title not in title_to_records:
+                title_to_records[title] = []
+            title_to_records[title].append(idx)
+    
+    # Самые частые заголовки обрабатываем первыми: они покрывают больше записей
+    pending_titles = [str(r.get('title', '')).strip() for r in load_pending_records('titles', **kwargs)]
+    unique_titles = order_by_coverage(title_to_records, pending_titles)
+    print(f"Уникальных заголовков: {len(unique_titles)}")
+    print(f"Примеры: {unique_titles[:3]}")
+    
+    # 2. Получаем API ключи
+    conn = BaseHook.get_connection('yandex_gpt')
+    api_key = conn.extra_dejson.get('api_key')
+    folder_id = conn.extra_dejson.get('folder_id')
+
+    # Дедлайн и бюджет запуска
+    budget = GptRunBudget.for_run(**kwargs)
+    print(f"Бюджет: до {budget.deadline.isoformat()}, "
+          f"запросов {budget.max_requests}, токенов {budget.max_tokens}")
+
+    # Чекпоинты: повторная попытка задачи пропускает уже готовые батчи
+    checkpoints = BatchCheckpointStore(kwargs.get('run_id'), 'titles')
+    checkpointed, checkpoint_usage = checkpoints.load()
+    budget.restore(checkpoint_usage)
+    if checkpointed:
+        print(f"Восстановлено из чекпоинтов: {len(checkpointed)} заголовков, "
+              f"запросов {checkpoint_usage['requests']}, токенов {checkpoint_usage['tokens']}")
+    
+    # 3. Прогоняем через каскад моделей (батчи первого уровня — по 15 заголовков)
+    # Пропускаем то, что уже готово по чекпоинтам прошлых попыток
+    titles_to_process = [item for item in unique_titles if item not in checkpointed]
+    print(f"Заголовков к обработке: {len(titles_to_process)} (из чекпоинтов: {len(checkpointed)})")
+    
+    def save_checkpoint(batch, results, usage):
+        checkpoints.save_batch(batch, results, requests_spent=usage['requests'], tokens_spent=usage['tokens'])
+    
+    normalized, deferred_titles, tier_stats = run_classification_stage(
+        TITLE_STAGE, titles_to_process, api_key, folder_id, budget, on_batch_done=save_checkpoint
+    )
+    all_normalized = list(checkpointed.values()) + list(normalized.values())
+    
+    stop_reason = budget.exhausted() if deferred_titles else None
+    if deferred_titles:
+        # Остановились аккуратно: остаток уйдёт в следующий запуск
+        print(f"\n⏹ Бюджет исчерпан ({stop_reason}), откладываем {len(deferred_titles)} заголовков")
+    
+    # 4. Создаём полный маппинг
+    title_mapping = {}
+    for item in all_normalized:
+        if isinstance(item, dict) and item.get('original'):
+            title_mapping[item['original']] = item.get('normalized_title', 'Не определена')
+    
+    # 5. Применяем ко всем записям
+    enriched_data = []
+    for record in raw_data:
+        original_title = record.get('title', '').strip()
+        enriched_record = record.copy()
+        enriched_record['normalized_title'] = title_mapping.get(original_title, 'Не определена')
+        enriched_data.append(enriched_record)
+    
+    # 6. Сохраняем
+    ti.xcom_push(key='data_with_normalized_titles', value=enriched_data)
+    ti.xcom_push(key='gpt_budget', value=budget.to_dict())
+    ti.xcom_push(key='deferred_titles', value=deferred_titles)
+    ti.xcom_push(key='gpt_stop_reason', value=stop_reason)
+    ti.xcom_push(key='gpt_tier_stats', value=tier_stats)
+    print(f"Расход бюджета: запросов {budget.spent_requests}, токенов {budget.spent_tokens}")
+    
+    # 7. Статистика
+    print(f"\n📊 Итоги нормализации заголовков:")
+    print(f"Всего записей: {len(enriched_data)}")
+    
+    normalized_counts = Counter([r['normalized_title'] for r in enriched_data])
+    
+    print("📈 Распределение по категориям:")
+    for category, count in normalized_counts.most_common(15):
+        percentage = (count / len(enriched_data)) * 100
+        print(f"  {category}: {count} записей ({percentage:.1f}%)")
+    
+    # Считаем успешность
+    success_count = sum(count for cat, count in normalized_counts.items() 
+                       if cat not in ['Не определена', 'Другое'])
+    success_rate = (success_count / len(enriched_data)) * 100
+    
+    # Детальная статистика по "Не определена"
+    undefined_count = normalized_counts.get('Не определена', 0)
+    if undefined_count > 0:
+        print(f"\n🔍 Анализ 'Не определена' ({undefined_count} записей):")
+        
+        # Находим примеры "Не определена"
+        undefined_titles = []
+        for record in enriched_data[:10]:  # Берём первые 10
+            if record['normalized_title'] == 'Не определена':
+                title = record.get('title', '')
+                if title:
+                    undefined_titles.append(title[:50] + '...' if len(title) > 50 else title)
+        
+        if undefined_titles:
+            print(f"  Примеры: {', '.join(undefined_titles[:5])}")
+    
+    print(f"\n✅ Успешно классифицировано: {success_rate:.1f}% записей")
+    
+    return f"Обработано {len(enriched_data)} записей, успех: {success_rate:.1f}%"
+
+# ========== ЗАДАЧА 4: Изменение сфер через YandexGPT (каскад моделей) ==========
+def working_with_gpt(**kwargs):
+    from airflow.hooks.base import BaseHook
+
+    ti = kwargs['ti']
+    print("\n=== Задача 4: Нормализация сфер деятельности через GPT ===")
+
+    # 1. Получаем данные из предыдущей задачи
+    raw_data = ti.xcom_pull(task_ids='title_with_gpt', key='data_with_normalized_titles')
+    if not raw_data:
+        print("Ошибка: Нет данных для обработки!")
+        return
+    
+    print(f"Получено {len(raw_data)} записей для нормализации.")
+    
+    # 2. Собираем ВСЕ УНИКАЛЬНЫЕ сферы деятельности
+    all_fields = []
+    field_to_records = {}
+    
+    for idx, record in enumerate(raw_data):
+        field = record.get('ai_field_of_activity', '').strip()
+        if field:  # Только непустые
+            all_fields.append(field)
+            if field not in field_to_records:
+                field_to_records[field] = []
+            field_to_records[field].append(idx)
+    
+    # Самые частые сферы обрабатываем первыми: они покрывают больше записей
+    pending_fields = [str(r.get('ai_field_of_activity', '')).strip() for r in load_pending_records('fields', **kwargs)]
+    unique_fields = order_by_coverage(field_to_records, pending_fields)
+    print(f"Уникальных сфер деятельности: {len(unique_fields)}")
+    print(f"Примеры: {unique_fields[:3]}")
+    
+    # 3. Получаем API ключи
+    conn = BaseHook.get_connection('yandex_gpt')
+    api_key = conn.extra_dejson.get('api_key')
+    folder_id = conn.extra_dejson.get('folder_id')
+    
+    print(f"API Key получен: {'Да' if api_key else 'Нет'}")
+
+    # Дедлайн и бюджет запуска (с учётом расхода задачи с заголовками)
+    budget = GptRunBudget.for_run(upstream_task_id='title_with_gpt', **kwargs)
+    print(f"Бюджет: до {budget.deadline.isoformat()}, "
+          f"уже потрачено запросов {budget.spent_requests}/{budget.max_requests}, "
+          f"токенов {budget.spent_tokens}/{budget.max_tokens}")
+
+    # Чекпоинты: повторная попытка задачи пропускает уже готовые батчи
+    checkpoints = BatchCheckpointStore(kwargs.get('run_id'), 'fields')
+    checkpointed, checkpoint_usage = checkpoints.load()
+    budget.restore(checkpoint_usage)
+    if checkpointed:
+        print(f"Восстановлено из чекпоинтов: {len(checkpointed)} сфер, "
+              f"запросов {checkpoint_usage['requests']}, токенов {checkpoint_usage['tokens']}")
+    
+    # 4. Прогоняем через каскад моделей (батчи первого уровня — по 10 сфер)
+    # Пропускаем то, что уже готово по чекпоинтам прошлых попыток
+    fields_to_process = [item for item in unique_fields if item not in checkpointed]
+    print(f"Сфер к обработке: {len(fields_to_process)} (из чекпоинтов: {len(checkpointed)})")
+    
+    def save_checkpoint(batch, results, usage):
+        checkpoints.save_batch(batch, results, requests_spent=usage['requests'], tokens_spent=usage['tokens'])
+    
+    normalized, deferred_fields, tier_stats = run_classification_stage(
+        FIELD_STAGE, fields_to_process, api_key, folder_id, budget, on_batch_done=save_checkpoint
+    )
+    all_normalized = list(checkpointed.values()) + list(normalized.values())
+    
+    stop_reason = budget.exhausted() if deferred_fields else None
+    if deferred_fields:
+        # Остановились аккуратно: остаток уйдёт в следующий запуск
+        print(f"\n⏹ Бюджет исчерпан ({stop_reason}), откладываем {len(deferred_fields)} сфер")
+    
+    # 5. Создаём полные маппинги
+    category_mapping = {}
+    specialization_mapping = {}
+    
+    for item in all_normalized:
+        if isinstance(item, dict) and item.get('original'):
+            category_mapping[item['original']] = item.get('category', 'Не определена')
+            specialization_mapping[item['original']] = item.get('specialization', 'Не определена')
+    
+    # 6. Применяем ко всем записям
+    enriched_data = []
+    for record in raw_data:
+        original_field = record.get('ai_field_of_activity', '').strip()
+        if not original_field:
+            original_field = 'Не указано'
+            
+        enriched_record = record.copy()
+        enriched_record['category'] = category_mapping.get(original_field, 'Не определена')
+        enriched_record['specialization'] = specialization_mapping.get(original_field, 'Не определена')
+        enriched_data.append(enriched_record)
+    
+    # 7. Сохраняем обогащённые данные
+    ti.xcom_push(key='data_with_normalized_working', value=enriched_data)
+    ti.xcom_push(key='gpt_budget', value=budget.to_dict())
+    ti.xcom_push(key='deferred_fields', value=deferred_fields)
+    ti.xcom_push(key='gpt_stop_reason', value=stop_reason)
+    ti.xcom_push(key='gpt_tier_stats', value=tier_stats)
+    print(f"Расход бюджета: запросов {budget.spent_requests}, токенов {budget.spent_tokens}")
+    
+    # 8. Статистика
+    print(f"\n=== Итоги нормализации сфер ===")
+    print(f"Всего записей: {len(enriched_data)}")
+    
+    category_counts = Counter([r['category'] for r in enriched_data])
+    specialization_counts = Counter([r['specialization'] for r in enriched_data])
+    
+    print(f"\n📊 Широкие категории (топ-5):")
+    for category, count in category_counts.most_common(5):
+        percentage = (count / len(enriched_data)) * 100
+        print(f"  {category}: {count} записей ({percentage:.1f}%)")
+    
+    print(f"\n🎯 Узкие специализации (топ-5):")
+    for spec, count in specialization_counts.most_common(5):
+        percentage = (count / len(enriched_data)) * 100
+        print(f"  {spec}: {count} записей ({percentage:.1f}%)")
+    
+    # Считаем успешность
+    success_count = sum(count for cat, count in category_counts.items() 
+                       if cat not in ['Не определена', 'Не указано', 'Другое'])
+    success_rate = (success_count / len(enriched_data)) * 100
+    
+    # Детальная статистика
+    undefined_count = category_counts.get('Не определена', 0)
+    if undefined_count > 0:
+        undefined_examples = []
+        for record in enriched_data[:5]:  # Берём первые 5
+            if record['category'] == 'Не определена':
+                field = record.get('ai_field_of_activity', '')
+                if field:
+                    undefined_examples.append(field[:50])
+        
+        if undefined_examples:
+            print(f"\n🔍 Примеры 'Не определена': {', '.join(undefined_examples)}...")
+    
+    print(f"\n✅ Успешно классифицировано: {success_rate:.1f}% ({success_count}/{len(enriched_data)})")
+    
+    return f"Обработано {len(enriched_data)} записей, успех: {success_rate:.1f}%"
+
+# ========== ЗАДАЧА 5: Сохранение обогащённых данных в S3 ==========
+def save_enriched_data_to_s3(**kwargs):
+    import pandas as pd
+
+    ti = kwargs['ti']
+    print("\n=== Задача 5: Сохранение обогащённых данных в S3 ===")
+    
+    # 1. Получаем обогащённые данные
+    enriched_data = ti.xcom_pull(task_ids='working_with_gpt', key='data_with_normalized_working')
+    if not enriched_data:
+        print("Ошибка: Нет обогащённых данных для сохранения!")
+        return
+    
+    print(f"Получено {len(enriched_data)} обогащённых записей")
+
+    # 2. Записи, отложенные из-за бюджета, не публикуем с заглушкой "Не определена":
+    # они попадут в processed/normalized/ тем запуском, который их действительно классифицирует
+    pending_by_stage = {}
+    for stage, (task_id, item_field) in PENDING_STAGES.items():
+        deferred = set(ti.xcom_pull(task_ids=task_id, key=f'deferred_{stage}') or [])
+        pending_by_stage[stage] = [
+            record for record in enriched_data if str(record.get(item_field, '')).strip() in deferred
+        ]
+    deferred_ids = {str(record.get('id')) for records in pending_by_stage.values() for record in records}
+    if deferred_ids:
+        enriched_data = [record for record in enriched_data if str(record.get('id')) not in deferred_ids]
+        print(f"Отложено до следующего запуска (не публикуем): {len(deferred_ids)} записей, "
+              f"к сохранению: {len(enriched_data)}")
+
+    # 3. GPT-этапы работали только с нужными колонками — подтягиваем полные строки
+    s3_client = get_s3_client()
+    source_files = ti.xcom_pull(task_ids='process_latest_file', key='source_files') or []
+    source_files += ti.xcom_pull(task_ids='process_latest_file', key='pending_files') or []
+    source_bucket = ti.xcom_pull(task_ids='process_latest_file', key='bucket_name') or BUCKET_NAME
+    if not enriched_data:
+        df = None
+    elif source_files:
+        enriched_df = pd.DataFrame(enriched_data)[['id'] + ENRICHED_COLUMNS]
+        full_df = load_vacancy_files(s3_client, source_bucket, source_files)
+        # Ключ соединения — строковый id: типы колонки в разных чтениях могут отличаться
+        full_df['_join_id'] = full_df['id'].astype(str)
+        enriched_df['_join_id'] = enriched_df.pop('id').astype(str)
+        df = full_df.merge(enriched_df, on='_join_id', how='inner').drop(columns=['_join_id'])
+    else:
+        print("Список исходных файлов не найден, сохраняем данные без полных строк")
+        df = pd.DataFrame(enriched_data).drop(columns=[SOURCE_FILE_COLUMN], errors='ignore')
+    
+    s3_key = None
+    if df is None or df.empty:
+        print("Все записи отложены — нечего публиковать в processed/normalized/")
+    else:
+        # 4. Добавляем мета-информацию
+        processing_date = datetime.now().strftime('%Y%m%d_%H%M%S')
+        df['_processing_date'] = processing_date
+        df['_processing_timestamp'] = datetime.now().isoformat()
+
+        print(f"Создан DataFrame: {len(df)} строк, {len(df.columns)} колонок")
+        print(f"Колонки: {list(df.columns)}")
+
+        # 5. Конвертируем в CSV
+        csv_buffer = df.to_csv(
+            index=False,
+            encoding='utf-8-sig',  # UTF-8 с BOM для лучшей совместимости
+            sep=',',               # Явно указываем разделитель
+            quotechar='"',         # Символ кавычек
+            escapechar='\\'       # Символ экранирования
+        )
+
+        # 6. Сохраняем в S3
+        s3_key = f"processed/normalized/vacancies_normalized_{processing_date}.csv"
+        s3_client.put_object(
+            Bucket=BUCKET_NAME,
+            Key=s3_key,
+            Body=csv_buffer.encode('utf-8'),
+            ContentType='text/csv'
+        )
+
+        print(f"Данные сохранены в S3: s3://{BUCKET_NAME}/{s3_key}")
+        print(f"Размер файла: {len(csv_buffer)} байт")
+
+    # 7. Сохраняем путь к файлу для возможного использования
+    ti.xcom_push(key='processed_file_path', value=s3_key)
+    ti.xcom_push(key='processed_record_count', value=0 if df is None else len(df))
+
+    # 8. Результат сохранён — остаток, отложенный из-за бюджета, передаём следующему запуску этого DAG
+    # (индекс файла меняем обратно на ключ: в следующем запуске список файлов будет другим)
+    for stage, (task_id, _) in PENDING_STAGES.items():
+        records = [
+            {
+                **{column: record.get(column) for column in GPT_INPUT_COLUMNS},
+                SOURCE_FILE_COLUMN: source_files[int(record[SOURCE_FILE_COLUMN])],
+            }
+            for record in pending_by_stage[stage]
+        ]
+        reason = ti.xcom_pull(task_ids=task_id, key='gpt_stop_reason')
+        save_pending_records(stage, records, reason, **kwargs)
+
+    # 9. Чекпоинты GPT-батчей этого запуска больше не нужны
+    removed = clear_run_checkpoints(kwargs.get('run_id'), s3_client=s3_client)
+    print(f"Удалено чекпоинтов: {removed}")
+    
+    return s3_key
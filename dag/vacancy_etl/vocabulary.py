@@ -0,0 +1,142 @@
+"""Словарь допустимых категорий: приводит почти верные ответы модели к точной метке.
+
+Модель иногда пишет "бизнес-аналитик" вместо "Бизнес аналитик" или "Data-аналитик"
+вместо "Аналитик данных". Такие ответы не отправляем повторно, а сопоставляем
+с ближайшей допустимой меткой: точное совпадение после нормализации, синонимы,
+затем кандидаты по триграммам с пословной проверкой на опечатки.
+
+Нечёткое сравнение целых строк тут не годится: "Менеджер проекта" и
+"Менеджер продукта" похожи на 88%, но это разные должности. Поэтому
+исправляются только опечатки: каждое слово ответа должно совпасть со словом
+метки с точностью до LABEL_SNAP_MAX_WORD_EDITS правок, короткие слова — точно.
+Всё остальное остаётся невалидным и уходит следующему уровню каскада.
+"""
+
+import re
+import threading
+from collections import Counter, defaultdict
+
+LABEL_SNAP_MAX_WORD_EDITS = 1       # Сколько правок (опечаток) допускаем в одном слове
+LABEL_SNAP_MIN_WORD_LENGTH = 4      # Слова короче сравниваем только точно
+_MAX_CANDIDATES = 10                # Сколько лучших кандидатов по триграммам проверяем пословно
+
+
+class LabelVocabulary:
+    """Индекс допустимых меток: нормализованные строки, синонимы и триграммы.
+
+    >>> vocabulary = LabelVocabulary(['Менеджер продукта', 'Разработчик', 'Бизнес аналитик'])
+    >>> vocabulary.match('Разработчк')[0]
+    'Разработчик'
+    >>> vocabulary.match('бизнес-аналитика')[0]
+    'Бизнес аналитик'
+    >>> vocabulary.match('Менеджер проекта')
+    (None, 0.0)
+    """
+
+    def __init__(self, labels, aliases=None, max_word_edits=LABEL_SNAP_MAX_WORD_EDITS):
+        self.labels = list(labels)
+        self.max_word_edits = max_word_edits
+        self._exact = {normalize_label(label): label for label in self.labels}
+        for alias, label in (aliases or {}).items():
+            self._exact[normalize_label(alias)] = label
+        self._keys = list(self._exact)
+        # Порядок слов не важен: "данных аналитик" == "аналитик данных"
+        self._by_sorted_words = {_sorted_words(key): self._exact[key] for key in self._keys}
+        self._trigram_index = defaultdict(set)
+        for position, key in enumerate(self._keys):
+            for trigram in _trigrams(key):
+                self._trigram_index[trigram].add(position)
+        self._cache = {}
+        self._lock = threading.Lock()
+
+    def __contains__(self, label):
+        return label in self.labels
+
+    def match(self, raw_label):
+        """Возвращает (допустимая метка или None, похожесть 0..1)."""
+        if not isinstance(raw_label, str) or not raw_label.strip():
+            return None, 0.0
+        key = normalize_label(raw_label)
+        with self._lock:
+            if key in self._cache:
+                return self._cache[key]
+
+        result = self._match_key(key)
+        with self._lock:
+            self._cache[key] = result
+        return result
+
+    def _match_key(self, key):
+        if key in self._exact:
+            return self._exact[key], 1.0
+        if _sorted_words(key) in self._by_sorted_words:
+            return self._by_sorted_words[_sorted_words(key)], 1.0
+
+        shared = Counter()
+        for trigram in _trigrams(key):
+            for position in self._trigram_index.get(trigram, ()):
+                shared[position] += 1
+        matches = {}  # метка -> наименьшее число правок
+        for position, _ in shared.most_common(_MAX_CANDIDATES):
+            candidate = self._keys[position]
+            edits = self._word_edits(key.split(), candidate.split())
+            label = self._exact[candidate]
+            if edits is not None and edits < matches.get(label, edits + 1):
+                matches[label] = edits
+        if not matches:
+            return None, 0.0
+        best_edits = min(matches.values())
+        best = [label for label, edits in matches.items() if edits == best_edits]
+        if len(best) > 1:
+            return None, 0.0  # Опечатка одинаково близка к двум меткам — не угадываем
+        return best[0], 1 - best_edits / len(key)
+
+    def _word_edits(self, words, label_words):
+        """Суммарные правки, если каждое слово — опечатка в слове метки, иначе None."""
+        if len(words) != len(label_words):
+            return None
+        total = 0
+        for word, label_word in zip(words, label_words):
+            if word == label_word:
+                continue
+            if min(len(word), len(label_word)) < LABEL_SNAP_MIN_WORD_LENGTH:
+                return None
+            edits = edit_distance(word, label_word)
+            if edits > self.max_word_edits:
+                return None
+            total += edits
+        return total
+
+
+def normalize_label(label):
+    """Регистр, ё/е, дефисы, тире, слэши и лишние пробелы не влияют на сравнение."""
+    label = label.casefold().replace('ё', 'е')
+    label = re.sub(r'[\s\-‐‑–—_/.,:;"\'«»()]+', ' ', label)
+    return label.strip()
+
+
+def edit_distance(a, b):
+    """Число опечаток: вставка, удаление, замена и перестановка соседних букв (по одной правке)."""
+    previous2, previous = None, list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            cost = min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b),
+            )
+            if i > 1 and j > 1 and char_a == b[j - 2] and a[i - 2] == char_b:
+                cost = min(cost, previous2[j - 2] + 1)
+            current.append(cost)
+        previous2, previous = previous, current
+    return previous[-1]
+
+
+def _trigrams(key):
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _sorted_words(key):
+    return ' '.join(sorted(key.split()))
@@ -0,0 +1,81 @@
+# ========== Импорт библиотек ==========
+# Событийный вариант пайплайна: запуск на каждую порцию новых файлов в vacancies/
+# вместо ежедневного полного скана. Тяжёлые зависимости — внутри задач (пакет vacancy_etl)
+# 1. Airflow
+from airflow import DAG
+from airflow.operators.python import PythonOperator
+# 2. Дата/время и интервалы
+from datetime import datetime, timedelta
+# 3. Задачи пайплайна
+from vacancy_etl.compaction import COMPACTION_POOL, compact_normalized_files
+from vacancy_etl.events import NewVacancyFilesSensor, commit_processed_files
+from vacancy_etl.tasks import (
+    process_latest_file,
+    save_enriched_data_to_s3,
+    title_with_gpt,
+    working_with_gpt,
+)
+
+default_args = {
+    'owner': 'airflow',
+    'retries': 2,
+    'retry_delay': timedelta(minutes=3),
+}
+
+# ========== ОПРЕДЕЛЕНИЕ DAG ==========
+# @continuous: как только запуск закончился, стартует следующий и снова ждёт новые файлы
+with DAG(
+    'vacancy_pipline_gpt_events',
+    default_args=default_args,
+    description='Пайплайн по событию: обработка новых файлов вакансий по мере поступления',
+    schedule='@continuous',
+    max_active_runs=1,
+    start_date=datetime(2024, 5, 1),
+    catchup=False,
+    tags=['portfolio', 'gpt', 'events'],
+) as dag:
+
+    task_wait = NewVacancyFilesSensor(
+        task_id='wait_for_new_files',
+        deferrable=True,               # Ожидание в triggerer, слот воркера не занят
+        poke_interval=60,
+        timeout=timedelta(hours=12).total_seconds(),
+        soft_fail=True,                # Нет файлов за 12 часов — пропускаем запуск, начинаем следующий
+        retries=0,
+    )
+
+    task_process = PythonOperator(
+        task_id='process_latest_file',
+        python_callable=process_latest_file,
+        # track_failed_files: неразобранный файл пропускается, ему засчитывается неудачная попытка
+        op_kwargs={'files_task_id': 'wait_for_new_files', 'max_files': None, 'track_failed_files': True},
+    )
+
+    task_title = PythonOperator(
+        task_id='title_with_gpt',
+        python_callable=title_with_gpt,
+    )
+
+    task_working = PythonOperator(
+        task_id='working_with_gpt',
+        python_callable=working_with_gpt,
+    )
+
+    task_save = PythonOperator(
+        task_id='save_enriched_data_to_s3',
+        python_callable=save_enriched_data_to_s3,
+    )
+
+    task_commit = PythonOperator(
+        task_id='commit_processed_files',
+        python_callable=commit_processed_files,
+    )
+
+    task_compact = PythonOperator(
+        task_id='compact_normalized_files',
+        python_callable=compact_normalized_files,
+        pool=COMPACTION_POOL,  # Общий пул на 1 слот с другим DAG: манифест пишет только одна компактизация
+    )
+
+    # Порядок: ждём файлы -> обработка -> заголовки -> сферы -> сохранение -> фиксация -> компактизация
+    task_wait >> task_process >> task_title >> task_working >> task_save >> task_commit >> task_compact